@@ -0,0 +1,314 @@
+"""
+Offline benchmark harness for the PDF Slicer hot paths.
+
+Generates synthetic PDFs (text-only and image-heavy, 10 to 10,000 pages) and
+times module import, page-count lookup, selection parsing, extraction and preview rendering.
+Every measurement runs in a fresh process so caches start cold and the peak RSS
+belongs to that measurement alone. Results are written as JSON and can be
+compared against an earlier run to catch regressions:
+
+    python bench_slicer.py -o results.json
+    python bench_slicer.py --quick --compare results.json
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# (kind, page counts) of the synthetic documents
+FULL_MATRIX = [("text", (10, 1000, 10000)), ("image", (10, 100, 1000))]
+QUICK_MATRIX = [("text", (10, 1000)), ("image", (10, 100))]
+
+# Side of the square grayscale image on every page of an image-heavy document
+IMAGE_SIDE = 256
+
+# Metrics where larger is better; for all others smaller is better
+HIGHER_IS_BETTER = {"pages_per_s", "mb_per_s"}
+
+
+def make_pdf(path, pages, kind, seed=0):
+    """
+    Write a synthetic PDF directly, without PyPDF2, so generation is fast and
+    does not depend on the code being measured. "text" pages carry a few lines
+    of text; "image" pages also draw a unique, incompressible image.
+    """
+    rng = random.Random(seed)
+    offsets = {}
+
+    with open(path, "wb") as f:
+
+        def write_object(number, body, stream=None):
+            offsets[number] = f.tell()
+            f.write(b"%d 0 obj\n" % number)
+            if stream is None:
+                f.write(body + b"\nendobj\n")
+            else:
+                f.write(body[:-2] + b" /Length %d >>\nstream\n" % len(stream))
+                f.write(stream + b"\nendstream\nendobj\n")
+
+        f.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+        write_object(1, b"<< /Type /Catalog /Pages 2 0 R >>")
+        write_object(
+            3, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"
+        )
+        kids = []
+        number = 4
+        for i in range(pages):
+            page_number, content_number, image_number = number, number + 1, number + 2
+            number += 3 if kind == "image" else 2
+            kids.append(page_number)
+
+            lines = [b"BT /F1 12 Tf 72 720 Td 14 TL"]
+            for line in range(20):
+                words = " ".join(f"w{rng.randrange(10000)}" for _ in range(8))
+                lines.append(b"(Page %d line %d %s) '" % (i + 1, line, words.encode()))
+            lines.append(b"ET")
+            resources = b"/Font << /F1 3 0 R >>"
+            if kind == "image":
+                lines.insert(0, b"q 400 0 0 400 100 100 cm /Im0 Do Q")
+                resources += b" /XObject << /Im0 %d 0 R >>" % image_number
+            content = zlib.compress(b"\n".join(lines))
+
+            write_object(
+                page_number,
+                b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+                b"/Resources << %s >> /Contents %d 0 R >>" % (resources, content_number),
+            )
+            write_object(
+                content_number, b"<< /Filter /FlateDecode >>", stream=content
+            )
+            if kind == "image":
+                write_object(
+                    image_number,
+                    b"<< /Type /XObject /Subtype /Image /Width %d /Height %d "
+                    b"/ColorSpace /DeviceGray /BitsPerComponent 8 >>"
+                    % (IMAGE_SIDE, IMAGE_SIDE),
+                    stream=rng.randbytes(IMAGE_SIDE * IMAGE_SIDE),
+                )
+
+        write_object(
+            2,
+            b"<< /Type /Pages /Count %d /Kids [%s] >>"
+            % (pages, b" ".join(b"%d 0 R" % kid for kid in kids)),
+        )
+        xref_offset = f.tell()
+        f.write(b"xref\n0 %d\n0000000000 65535 f \n" % number)
+        for n in range(1, number):
+            f.write(b"%010d 00000 n \n" % offsets[n])
+        f.write(
+            b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n"
+            % (number, xref_offset)
+        )
+
+
+def _peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+def _measure(stage, path, pages, workdir):
+    """Run one stage in this (fresh) process and return its metrics."""
+    started = time.perf_counter()
+    import pdf_slicer
+
+    if stage != "import":
+        started = time.perf_counter()
+    metrics = {}
+    if stage == "page_count":
+        metrics["count"] = pdf_slicer.DocumentSession(path).page_count
+    elif stage == "page_count_quick":
+        metrics["count"] = pdf_slicer.quick_page_count(path)
+    elif stage == "parse_selection":
+        # A few large ranges and a long list of single pages
+        for selection_str in (
+            f"1-{pages}",
+            "odd",
+            f"{pages}-1:3",
+            ", ".join(str(p) for p in range(1, pages + 1, 2)),
+        ):
+            pdf_slicer.parse_page_selection(selection_str, pages)
+    elif stage in ("extract", "extract_streaming"):
+        document = pdf_slicer.DocumentSession(path)
+        output_path = os.path.join(workdir, f"{stage}.pdf")
+        pdf_slicer.extract_to_file(
+            document,
+            pdf_slicer.parse_page_selection(f"1-{pages}", pages),
+            output_path,
+            streaming=stage == "extract_streaming",
+        )
+        elapsed = time.perf_counter() - started
+        metrics["pages_per_s"] = pages / elapsed
+        metrics["mb_per_s"] = os.path.getsize(output_path) / elapsed / 1e6
+    elif stage == "preview":
+        selected = list(range(1, min(pages, 10) + 1))
+        cache = pdf_slicer.ThumbnailCache(os.path.join(workdir, "thumbnails"))
+        first = None
+        for _ in pdf_slicer.iter_thumbnails(
+            path, selected, workers=pdf_slicer.PREVIEW_WORKERS, cache=cache
+        ):
+            if first is None:
+                first = time.perf_counter() - started
+        metrics["first_page_seconds"] = first
+    metrics["seconds"] = time.perf_counter() - started
+    metrics["peak_rss_mb"] = _peak_rss_mb()
+    return metrics
+
+
+def run_stage(stage, path, pages, workdir, repeat):
+    """Measure a stage `repeat` times, each in a new process; keep the median."""
+    context = multiprocessing.get_context("spawn")
+    runs = []
+    for _ in range(repeat):
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+            runs.append(pool.submit(_measure, stage, path, pages, workdir).result())
+    merged = {}
+    for key in runs[0]:
+        values = [run[key] for run in runs if run[key] is not None]
+        if key == "count":
+            merged[key] = runs[0][key]
+        elif values:
+            merged[key] = statistics.median(values)
+        else:
+            merged[key] = None
+    return merged
+
+
+def compare(results, baseline, tolerance, min_seconds):
+    """
+    Return a list of human readable regressions against a baseline run. Timings
+    of stages that took less than min_seconds in the baseline are too noisy to
+    compare and only their memory use is checked.
+    """
+    previous = {
+        (r["kind"], r["pages"], r["stage"]): r for r in baseline.get("results", [])
+    }
+    regressions = []
+    for result in results:
+        old = previous.get((result["kind"], result["pages"], result["stage"]))
+        if old is None:
+            continue
+        metrics = ["peak_rss_mb"]
+        if old["seconds"] >= min_seconds:
+            metrics += ["seconds", "first_page_seconds", "pages_per_s", "mb_per_s"]
+        for metric in metrics:
+            new_value, old_value = result.get(metric), old.get(metric)
+            if not new_value or not old_value:
+                continue
+            if metric in HIGHER_IS_BETTER:
+                worse = new_value < old_value * (1 - tolerance)
+            else:
+                worse = new_value > old_value * (1 + tolerance)
+            if worse:
+                regressions.append(
+                    f"{result['kind']}/{result['pages']}/{result['stage']}: "
+                    f"{metric} {old_value:.4g} -> {new_value:.4g}"
+                )
+    return regressions
+
+
+def main(argv=None):
+    """Entry point; returns the process exit code."""
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("-o", "--output", help="write JSON results to this file")
+    parser.add_argument("--quick", action="store_true", help="smaller documents only")
+    parser.add_argument(
+        "--repeat", type=int, default=3, help="runs per measurement (default: 3)"
+    )
+    parser.add_argument("--compare", help="baseline JSON results to compare against")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.25,
+        help="allowed relative slowdown before --compare fails (default: 0.25)",
+    )
+    parser.add_argument(
+        "--min-seconds",
+        type=float,
+        default=0.05,
+        help="ignore timings below this in the baseline when comparing (default: 0.05)",
+    )
+    args = parser.parse_args(argv)
+
+    stages = ["import", "page_count", "page_count_quick", "parse_selection", "extract", "extract_streaming"]
+    if shutil.which("pdftoppm"):
+        stages.append("preview")
+    else:
+        print("pdftoppm not found, skipping preview measurements", file=sys.stderr)
+
+    results = []
+    workdir = tempfile.mkdtemp(prefix="pdf_slicer_bench_")
+    try:
+        for kind, page_counts in QUICK_MATRIX if args.quick else FULL_MATRIX:
+            for pages in page_counts:
+                path = os.path.join(workdir, f"{kind}_{pages}.pdf")
+                make_pdf(path, pages, kind)
+                size_mb = os.path.getsize(path) / 1e6
+                for stage in stages:
+                    metrics = run_stage(stage, path, pages, workdir, args.repeat)
+                    metrics.pop("count", None)
+                    result = {"kind": kind, "pages": pages, "input_mb": size_mb}
+                    result["stage"] = stage
+                    result.update(metrics)
+                    results.append(result)
+                    rates = ""
+                    if "pages_per_s" in metrics:
+                        rates = (
+                            f"  {metrics['pages_per_s']:9.1f} pages/s"
+                            f"  {metrics['mb_per_s']:7.2f} MB/s"
+                        )
+                    rss = metrics["peak_rss_mb"]
+                    print(
+                        f"{kind:5} {pages:6} pages {size_mb:8.1f} MB  {stage:18}"
+                        f"{metrics['seconds']:9.4f}s"
+                        + (f"  peak {rss:7.1f} MB" if rss is not None else "")
+                        + rates,
+                        flush=True,
+                    )
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "repeat": args.repeat,
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            regressions = compare(
+                results, json.load(f), args.tolerance, args.min_seconds
+            )
+        for line in regressions:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
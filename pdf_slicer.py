@@ -1,10 +1,2161 @@
-import tkinter as tk
-from tkinter import filedialog
-import PyPDF2
+import time
+
+# Time of the module load, for --startup-time
+_STARTED = time.perf_counter()
+
 import os
-from pdf2image import convert_from_path
-from PIL import ImageTk, Image
 import threading  # Added import
+import importlib
+import itertools
+import bisect
+import hashlib
+import contextlib
+import io
+import zlib
+import gzip
+import re
+import mmap
+import tempfile
+import subprocess
+import queue
+import shutil
+import signal
+import urllib.parse
+import sys
+import csv
+import json
+import argparse
+import cProfile
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# Width in pixels of the page images shown in the preview window
+PREVIEW_WIDTH = 500
+# Number of poppler processes used to rasterize preview pages in parallel
+PREVIEW_WORKERS = max(1, int(os.environ.get("PDF_SLICER_PREVIEW_WORKERS", 0)) or os.cpu_count() or 1)
+# Largest number of pages rasterized by a single poppler call during preview
+PREVIEW_CHUNK_PAGES = 8
+# Pages kept rendered above and below the visible part of the preview window,
+# as far as the memory budget allows
+PREVIEW_PAGE_MARGIN = 2
+# Memory for preview page images: a quarter for the compressed in-memory
+# thumbnail cache, the rest for the images shown in the preview window
+PREVIEW_MEMORY_BYTES = int(os.environ.get("PDF_SLICER_PREVIEW_MEMORY_MB", 200)) * 1024 * 1024
+# Where rendered preview pages are cached between runs, and the size limits
+CACHE_DIR = os.path.join(
+    os.environ.get("LOCALAPPDATA")
+    or os.environ.get("XDG_CACHE_HOME")
+    or os.path.join(os.path.expanduser("~"), ".cache"),
+    "pdf_slicer",
+)
+THUMBNAIL_CACHE_DIR = os.path.join(CACHE_DIR, "thumbnails")
+THUMBNAIL_CACHE_DISK_BYTES = 500 * 1024 * 1024
+THUMBNAIL_CACHE_MEMORY_BYTES = PREVIEW_MEMORY_BYTES // 4
+# Number of parsed input documents kept open for reuse
+DOCUMENT_CACHE_SIZE = 4
+# Memory-map inputs instead of reading them through the file object. Faster, but
+# if a file is truncated or rewritten in place while it is being read, the
+# process dies with SIGBUS; `serve` always reads through the file object.
+DOCUMENT_MMAP = os.environ.get("PDF_SLICER_MMAP", "1") != "0"
+# Inputs of at least this size are extracted page by page with bounded memory
+STREAMING_EXTRACT_BYTES = 256 * 1024 * 1024
+# Text of every page per document, for text:"..." selections
+TEXT_INDEX_DIR = os.path.join(CACHE_DIR, "text-index")
+# Build the text index as soon as a file is selected in the window instead of
+# on the first text:"..." query, with fewer processes so the app stays usable
+TEXT_INDEX_IN_BACKGROUND = os.environ.get("PDF_SLICER_TEXT_INDEX_IN_BACKGROUND") == "1"
+TEXT_INDEX_BACKGROUND_WORKERS = max(1, PREVIEW_WORKERS // 4)
+# Fewest pages worth an extra process when extracting text for the index
+TEXT_INDEX_CHUNK_PAGES = 200
+# Requests the HTTP service lets wait for a worker before answering 503
+SERVICE_QUEUE = 16
+SERVICE_MAX_UPLOAD_BYTES = 512 * 1024 * 1024
+
+# Read the process umask once so atomically written outputs get normal permissions
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+_windows_memory_info = None  # (GetProcessMemoryInfo, counters type), made on first use
+
+
+def _windows_working_set():
+    """Working set of this process in bytes, read with GetProcessMemoryInfo."""
+    global _windows_memory_info
+    import ctypes  # Deferred, only needed once a stage is timed
+
+    if _windows_memory_info is None:
+        from ctypes import wintypes
+
+        class ProcessMemoryCounters(ctypes.Structure):
+            _fields_ = [("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD)] + [
+                (name, ctypes.c_size_t)
+                for name in (
+                    "PeakWorkingSetSize",
+                    "WorkingSetSize",
+                    "QuotaPeakPagedPoolUsage",
+                    "QuotaPagedPoolUsage",
+                    "QuotaPeakNonPagedPoolUsage",
+                    "QuotaNonPagedPoolUsage",
+                    "PagefileUsage",
+                    "PeakPagefileUsage",
+                )
+            ]
+
+        get_info = ctypes.WinDLL("kernel32").K32GetProcessMemoryInfo
+        get_info.argtypes = [
+            wintypes.HANDLE,
+            ctypes.POINTER(ProcessMemoryCounters),
+            wintypes.DWORD,
+        ]
+        get_info.restype = wintypes.BOOL
+        _windows_memory_info = (get_info, ProcessMemoryCounters)
+    get_info, counters_type = _windows_memory_info
+    counters = counters_type()
+    counters.cb = ctypes.sizeof(counters)
+    # -1 is the pseudo handle of the current process
+    if not get_info(-1, ctypes.byref(counters), counters.cb):
+        return None
+    return counters.WorkingSetSize
+
+
+def _current_rss():
+    """
+    Resident memory of this process in bytes: the working set on Windows, the
+    resident set from /proc on Linux, and elsewhere (macOS, BSD) the peak
+    resident set, so deltas there only show growth of the peak. None where
+    none of these can be read.
+    """
+    if sys.platform == "win32":
+        try:
+            return _windows_working_set()
+        except (OSError, AttributeError):
+            return None
+    try:
+        with open("/proc/self/statm", "rb") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError, IndexError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Bytes on macOS, kilobytes on the other Unixes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class Instrumentation:
+    """
+    Records every pipeline stage (open, parse, select, render, display, write...)
+    with its duration, optional byte count and process memory delta. Records are
+    kept in memory for the debug panel and, if log_path is set, appended to it as
+    JSON lines. With profile_path set, threads started through `profiled` run
+    under cProfile and dump_profile() writes their combined stats.
+    Memory deltas are process wide, so concurrent stages see each other's usage.
+    """
+
+    def __init__(self, log_path=None, profile_path=None, max_records=2000):
+        self.log_path = log_path
+        self.profile_path = profile_path
+        self.records = deque(maxlen=max_records)
+        self._profiles = []
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def stage(self, name, **details):
+        """
+        Time the body of a with-block as one stage. The yielded dict is the
+        record itself, so the body can add details such as "bytes".
+        """
+        record = {"stage": name}
+        record.update(details)
+        rss_before = _current_rss()
+        started = time.perf_counter()
+        try:
+            yield record
+        except BaseException as e:
+            record["error"] = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            record["seconds"] = time.perf_counter() - started
+            rss_after = _current_rss()
+            if rss_before is not None and rss_after is not None:
+                record["memory_delta"] = rss_after - rss_before
+            record["thread"] = threading.current_thread().name
+            record["time"] = time.time()
+            self._add(record)
+
+    def _add(self, record):
+        with self._lock:
+            self.records.append(record)
+            if self.log_path:
+                try:
+                    with open(self.log_path, "a", encoding="utf-8") as f:
+                        f.write(json.dumps(record, default=str) + "\n")
+                except OSError:
+                    self.log_path = None  # Do not fail the pipeline over logging
+
+    def summary(self):
+        """Per-stage totals: {stage: {count, seconds, max_seconds, bytes, memory_delta}}."""
+        with self._lock:
+            records = list(self.records)
+        totals = OrderedDict()
+        for record in records:
+            total = totals.setdefault(
+                record["stage"],
+                {"count": 0, "seconds": 0.0, "max_seconds": 0.0, "bytes": 0, "memory_delta": 0},
+            )
+            total["count"] += 1
+            total["seconds"] += record["seconds"]
+            total["max_seconds"] = max(total["max_seconds"], record["seconds"])
+            total["bytes"] += record.get("bytes", 0)
+            total["memory_delta"] += record.get("memory_delta", 0)
+        return totals
+
+    def clear(self):
+        """Forget the in-memory records (the log file is kept)."""
+        with self._lock:
+            self.records.clear()
+
+    def profiled(self, target):
+        """Wrap a thread target so it runs under cProfile when profiling is on."""
+
+        def run(*args, **kwargs):
+            if not self.profile_path:
+                return target(*args, **kwargs)
+            profile = cProfile.Profile()
+            try:
+                return profile.runcall(target, *args, **kwargs)
+            finally:
+                with self._lock:
+                    self._profiles.append(profile)
+
+        return run
+
+    def dump_profile(self):
+        """Write the combined cProfile stats of all profiled threads."""
+        with self._lock:
+            profiles = list(self._profiles)
+        if self.profile_path and profiles:
+            import pstats  # Only needed here; slow to import at startup
+
+            pstats.Stats(*profiles).dump_stats(self.profile_path)
+
+
+instrumentation = Instrumentation(
+    log_path=os.environ.get("PDF_SLICER_LOG"),
+    profile_path=os.environ.get("PDF_SLICER_PROFILE"),
+)
+
+
+class _LazyModule:
+    """
+    Stand-in for a module that is imported on first attribute access, so the
+    window can appear before the heavy PDF and imaging libraries are loaded.
+    Example: PyPDF2 = _LazyModule("PyPDF2"); PyPDF2.PdfReader(...) imports it.
+    """
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def load(self):
+        """Import the module now (if it is not yet) and return it."""
+        if self._module is None:
+            # import_module also waits for an import in progress on another
+            # thread, where sys.modules already holds a half initialized module
+            if self._name in sys.modules:
+                self._module = importlib.import_module(self._name)
+            else:
+                with instrumentation.stage("import", module=self._name):
+                    self._module = importlib.import_module(self._name)
+        return self._module
+
+    def __getattr__(self, attr):
+        # Only called for names not cached yet; later lookups skip the proxy
+        value = getattr(self.load(), attr)
+        self.__dict__[attr] = value
+        return value
+
+    def __repr__(self):
+        state = "loaded" if self._module is not None else "not loaded"
+        return f"<lazy module {self._name!r} ({state})>"
+
+
+tk = _LazyModule("tkinter")
+filedialog = _LazyModule("tkinter.filedialog")
+PyPDF2 = _LazyModule("PyPDF2")
+generic = _LazyModule("PyPDF2.generic")
+Image = _LazyModule("PIL.Image")
+ImageTk = _LazyModule("PIL.ImageTk")
+
+# Modules loaded by warm_up() once the window is shown
+WARM_UP_MODULES = (PyPDF2, generic, Image, ImageTk)
+
+
+def warm_up(modules=WARM_UP_MODULES):
+    """Import the lazily loaded modules, e.g. in a background thread."""
+    for module in modules:
+        module.load()
+
+
+_RANGE_PATTERN = re.compile(r"^(\d*)\s*-\s*(\d*)(?:\s*:\s*(\d+))?$")
+_TEXT_QUERY_PATTERN = re.compile(r'^text\s*:\s*(?:"([^"]*)"|([^"]+))$', re.I)
+# A part of a selection ends at a comma that is not inside quotes
+_SELECTION_PART_PATTERN = re.compile(r'(?:"[^"]*"?|[^,"])+')
+
+
+class PageSelection:
+    """
+    A parsed page selection: an ordered list of `range` objects of 0-based page
+    indices. Iterating yields the indices lazily in selection order, so even a
+    huge selection costs O(number of ranges) to parse and to store.
+    """
+
+    def __init__(self, ranges):
+        self.ranges = ranges
+
+    def __iter__(self):
+        return itertools.chain.from_iterable(self.ranges)
+
+    def __len__(self):
+        return sum(len(r) for r in self.ranges)
+
+    def __bool__(self):
+        return any(self.ranges)
+
+    def __repr__(self):
+        return f"PageSelection({self.ranges!r})"
+
+
+def parse_page_selection(selection_str, total_pages, pdf_path=None):
+    """
+    Parse a page selection string into a PageSelection of 0-based page indices.
+    Parts are separated by commas and pages start from 1:
+      7        a single page
+      3-5      an inclusive range; 5-3 is the same pages in reverse order
+      10-, -4  open ranges up to the last page / from the first page
+      1-9:2    a range with a step (pages 1, 3, 5, 7, 9)
+      odd, even  all odd or all even pages
+      text:"Invoice"  the pages of pdf_path containing the text (see text_index)
+    Example input: "1-2, 5-7, 11, 13"
+    Iterates as: 0, 1, 4, 5, 6, 10, 12
+    """
+    with instrumentation.stage("select", parts=selection_str.count(",") + 1):
+        return _parse_page_selection(selection_str, total_pages, pdf_path)
+
+
+def _parse_page_selection(selection_str, total_pages, pdf_path):
+    ranges = []
+    for part in _SELECTION_PART_PATTERN.findall(selection_str):
+        part = part.strip()
+        if not part:  # Skip empty parts
+            continue
+        keyword = part.lower()
+        if keyword.startswith("text"):
+            match = _TEXT_QUERY_PATTERN.match(part)
+            if not match:
+                raise ValueError(f"Invalid text query: {part}")
+            query = match.group(1) if match.group(1) is not None else match.group(2)
+            if not query.strip():
+                raise ValueError(f"Empty text query: {part}")
+            if pdf_path is None:
+                raise ValueError(f"Text queries need an input PDF: {part}")
+            pages = text_index(pdf_path).find(query)
+            ranges.extend(
+                range(first - 1, last)
+                for first, last in page_runs(p + 1 for p in pages if p < total_pages)
+            )
+            continue
+        if keyword in ("odd", "even"):
+            ranges.append(range(0 if keyword == "odd" else 1, total_pages, 2))
+            continue
+        if part.isdigit():
+            start = end = int(part)
+            step = 1
+        else:
+            match = _RANGE_PATTERN.match(part)
+            if not match or not (match.group(1) or match.group(2)):
+                raise ValueError(f"Invalid range: {part}")
+            start = int(match.group(1)) if match.group(1) else 1
+            end = int(match.group(2)) if match.group(2) else total_pages
+            step = int(match.group(3) or 1)
+            if step < 1:
+                raise ValueError(f"Invalid step in range: {part}")
+        # Both ends are validated once, every page in between is then valid too
+        for p in (start, end):
+            if p < 1 or p > total_pages:
+                raise ValueError(f"Page {p} is out of range (1-{total_pages})")
+        if start <= end:
+            ranges.append(range(start - 1, end, step))  # Convert to 0-based
+        else:
+            ranges.append(range(start - 1, end - 2, -step))
+    return PageSelection(ranges)
+
+
+def page_runs(page_numbers):
+    """
+    Group 1-based page numbers into sorted, de-duplicated contiguous runs.
+    Example input: [9, 1, 2, 3, 3, 7]
+    Returns: [(1, 3), (7, 7), (9, 9)]
+    """
+    runs = []
+    for p in sorted(set(page_numbers)):
+        if runs and p == runs[-1][1] + 1:
+            runs[-1] = (runs[-1][0], p)
+        else:
+            runs.append((p, p))
+    return runs
+
+
+def split_runs(runs, max_length):
+    """
+    Split contiguous runs so that none covers more than max_length pages.
+    Example input: [(1, 5), (9, 9)] with max_length 2
+    Returns: [(1, 2), (3, 4), (5, 5), (9, 9)]
+    """
+    pieces = []
+    for first, last in runs:
+        while first <= last:
+            end = min(first + max_length - 1, last)
+            pieces.append((first, end))
+            first = end + 1
+    return pieces
+
+
+def thumbnail_size(page, width=PREVIEW_WIDTH):
+    """
+    Return the (width, height) in pixels that a PyPDF2 page is rendered at when
+    poppler scales it to the given width. Uses the crop box, which is what
+    poppler rasterizes, and honours the page rotation.
+    """
+    box_width = float(page.cropbox.width)
+    box_height = float(page.cropbox.height)
+    if page.get("/Rotate", 0) % 180:
+        box_width, box_height = box_height, box_width
+    return width, max(1, round(width * box_height / box_width))
+
+
+class RenderJob:
+    """
+    A cancelable preview render. cancel() stops it from starting more poppler
+    processes and kills the ones still running, so the render ends at once.
+    """
+
+    def __init__(self):
+        self.cancelled = threading.Event()
+        self.finished = threading.Event()
+        self._processes = set()
+        self._lock = threading.Lock()
+
+    def cancel(self):
+        """Stop the job and kill its running poppler processes."""
+        with self._lock:
+            self.cancelled.set()
+            processes = list(self._processes)
+        for process in processes:
+            process.kill()
+
+    @contextlib.contextmanager
+    def process(self, args):
+        """
+        Start a command for this job and yield its Popen, or None if the job is
+        already cancelled. A process still running when the block ends, e.g.
+        because nobody wants its output any more, is killed.
+        """
+        startupinfo = None
+        if sys.platform == "win32":
+            # Keep a console window from popping up for every poppler call
+            startupinfo = subprocess.STARTUPINFO()
+            startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+        process = None
+        with self._lock:
+            if not self.cancelled.is_set():
+                process = subprocess.Popen(
+                    args,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.DEVNULL,
+                    startupinfo=startupinfo,
+                )
+                self._processes.add(process)
+        try:
+            yield process
+        finally:
+            if process is not None:
+                process.kill()  # Does nothing once it has exited
+                process.stdout.close()
+                process.wait()
+                with self._lock:
+                    self._processes.discard(process)
+
+
+class PreviewScheduler:
+    """
+    Runs preview jobs on background threads, at most one per document: a new
+    job for a document cancels the running one and starts once it has stopped,
+    so the newest request always wins and renders never pile up.
+    """
+
+    def __init__(self):
+        self._jobs = {}  # absolute path -> newest RenderJob
+        self._lock = threading.Lock()
+
+    def submit(self, path, target):
+        """Supersede the document's current job with target(job); returns the job."""
+        key = os.path.abspath(path)
+        job = RenderJob()
+        with self._lock:
+            previous = self._jobs.get(key)
+            self._jobs[key] = job
+        if previous is not None:
+            previous.cancel()
+
+        def run():
+            try:
+                if previous is not None:
+                    previous.finished.wait()
+                if not job.cancelled.is_set():
+                    target(job)
+            finally:
+                job.finished.set()
+                with self._lock:
+                    if self._jobs.get(key) is job:
+                        del self._jobs[key]
+
+        threading.Thread(target=instrumentation.profiled(run), daemon=True).start()
+        return job
+
+    def cancel(self, path):
+        """Cancel the running job of a document, if any."""
+        with self._lock:
+            job = self._jobs.get(os.path.abspath(path))
+        if job is not None:
+            job.cancel()
+
+
+preview_scheduler = PreviewScheduler()
+
+
+def read_ppm(stream):
+    """
+    Read the next binary PPM (P6) or PGM (P5) image, as written by pdftoppm,
+    from a stream. Returns a PIL image, or None at the end of the stream or if
+    it stops in the middle of an image (e.g. because poppler was killed).
+    """
+    tokens = []
+    while len(tokens) < 4:  # magic number, width, height, maximum value
+        token = b""
+        while True:
+            c = stream.read(1)
+            if not c:
+                return None
+            if c.isspace():
+                if token:
+                    break
+            elif c == b"#" and not token:
+                stream.readline()  # Comment
+            else:
+                token += c
+        tokens.append(token)
+    magic, width, height, maxval = tokens
+    mode = {b"P6": "RGB", b"P5": "L"}.get(magic)
+    if mode is None or maxval != b"255":
+        raise ValueError(f"Unsupported image from pdftoppm: {magic!r}")
+    size = (int(width), int(height))
+    data = stream.read(size[0] * size[1] * len(mode))
+    if len(data) < size[0] * size[1] * len(mode):
+        return None
+    return Image.frombytes(mode, size, data)
+
+
+def iter_rendered_pages(pdf_path, page_numbers, width=PREVIEW_WIDTH, workers=1, job=None):
+    """
+    Rasterize only the given 1-based pages at the given width and yield
+    (page_number, image) pairs as soon as each page is rendered. Runs are split
+    into chunks of at most PREVIEW_CHUNK_PAGES that are rendered by up to
+    `workers` poppler processes. Pages are read from poppler one at a time and
+    at most a few wait for the consumer, so memory use does not grow with the
+    number of pages. Cancelling `job` kills poppler and ends the iteration;
+    so does closing the generator.
+    """
+    runs = page_runs(page_numbers)
+    if not runs:
+        return
+    total = sum(last - first + 1 for first, last in runs)
+    chunk_length = max(1, min(PREVIEW_CHUNK_PAGES, -(-total // workers)))
+    # The first page gets a chunk of its own so it shows up after one page's work
+    first, last = runs[0]
+    rest = ([(first + 1, last)] if last > first else []) + runs[1:]
+    chunks = [(first, first)] + split_runs(rest, chunk_length)
+    own_job = job is None
+    job = job or RenderJob()
+    # Rendered pages waiting for the consumer; a full queue pauses poppler
+    results = queue.Queue(maxsize=max(2, workers))
+    stopped = threading.Event()
+
+    def put(item):
+        while not stopped.is_set():
+            try:
+                results.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def render_chunk(chunk):
+        error = None
+        try:
+            with instrumentation.stage(
+                "render", first_page=chunk[0], last_page=chunk[1], bytes=0
+            ) as record:
+                args = [
+                    "pdftoppm",
+                    "-f", str(chunk[0]),
+                    "-l", str(chunk[1]),
+                    "-scale-to-x", str(width),
+                    "-scale-to-y", "-1",
+                    pdf_path,
+                ]
+                try:
+                    with job.process(args) as process:
+                        # pdftoppm writes the pages as consecutive PPM images to
+                        # stdout; each is handed on before the next is read
+                        for page in itertools.count(chunk[0]) if process else ():
+                            image = read_ppm(process.stdout)
+                            if image is None or not put((page, image)):
+                                break
+                            record["bytes"] += (
+                                image.width * image.height * len(image.getbands())
+                            )
+                except FileNotFoundError:
+                    raise RuntimeError("pdftoppm not found, is poppler installed?")
+                record["cancelled"] = job.cancelled.is_set()
+        except Exception as e:
+            error = e
+        finally:
+            put((None, error))  # This chunk is done
+
+    # Each poppler call is its own process, so threads are enough to keep
+    # several cores busy.
+    pool = ThreadPoolExecutor(max_workers=max(1, min(workers, len(chunks))))
+    try:
+        for chunk in chunks:
+            pool.submit(render_chunk, chunk)
+        pending = len(chunks)
+        while pending:
+            page, item = results.get()
+            if page is None:
+                pending -= 1
+                if item is not None:
+                    raise item
+            elif job.cancelled.is_set():
+                return
+            else:
+                # Pages past the end of the document simply produce no image
+                yield page, item
+    finally:
+        # Stop handing out chunks and release poppler if the consumer went away
+        stopped.set()
+        pool.shutdown(wait=False, cancel_futures=True)
+        if own_job:
+            job.cancel()
+
+
+_fingerprints = {}
+_fingerprints_lock = threading.Lock()
+
+
+def file_fingerprint(path):
+    """
+    Return a hex digest of the file's content. The hash is computed once per
+    version of the file (path, size and modification time) and then reused.
+    """
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    with _fingerprints_lock:
+        if key in _fingerprints:
+            return _fingerprints[key]
+    digest = hashlib.blake2b(digest_size=20)
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    with _fingerprints_lock:
+        _fingerprints[key] = digest.hexdigest()
+    return _fingerprints[key]
+
+
+class DocumentSession:
+    """
+    An input PDF opened and parsed once, then shared by the page-count display,
+    preview and extraction. With use_mmap the file is memory-mapped so PyPDF2
+    reads pages straight from the page cache (see DOCUMENT_MMAP for the risk).
+    PdfReader is not thread safe, so hold `lock` while using `reader`.
+    """
+
+    def __init__(self, path, use_mmap=True):
+        self.path = os.path.abspath(path)
+        self.version = _file_version(self.path)
+        self.lock = threading.RLock()
+        with instrumentation.stage("open", path=self.path, bytes=self.version[0]):
+            self._file = open(self.path, "rb")
+            self._map = None
+            if use_mmap:
+                try:
+                    self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+                except (OSError, ValueError):
+                    pass  # Empty or unmappable file, read it normally
+        try:
+            with instrumentation.stage("parse", path=self.path):
+                self.reader = PyPDF2.PdfReader(
+                    self._map if self._map is not None else self._file
+                )
+        except Exception:
+            self.close()
+            raise
+        self._page_count = None
+
+    @property
+    def page_count(self):
+        """Number of pages in the document."""
+        with self.lock:
+            if self._page_count is None:
+                with instrumentation.stage("parse_pages", path=self.path):
+                    self._page_count = len(self.reader.pages)
+            return self._page_count
+
+    @property
+    def fingerprint(self):
+        """Content hash of the document, see file_fingerprint."""
+        return file_fingerprint(self.path)
+
+    def is_current(self):
+        """True while the file on disk still has the size and mtime we parsed."""
+        try:
+            return _file_version(self.path) == self.version
+        except OSError:
+            return False
+
+    def close(self):
+        """Release the file handle and the memory map."""
+        if self._map is not None:
+            self._map.close()
+        self._file.close()
+
+
+def _file_version(path):
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns
+
+
+_documents = OrderedDict()  # absolute path -> DocumentSession, oldest first
+_documents_lock = threading.Lock()
+
+
+def open_document(path):
+    """
+    Return the shared DocumentSession for a PDF, parsing it only if it is not
+    cached yet or the file changed (size or mtime) since it was parsed.
+    """
+    path = os.path.abspath(path)
+    with _documents_lock:
+        session = _documents.get(path)
+        if session is not None and session.is_current():
+            _documents.move_to_end(path)
+            return session
+        # Stale or evicted sessions are not closed here, another thread may
+        # still be using them; they are released once no longer referenced.
+        _documents.pop(path, None)
+    session = DocumentSession(path, use_mmap=DOCUMENT_MMAP)
+    with _documents_lock:
+        _documents[path] = session
+        while len(_documents) > DOCUMENT_CACHE_SIZE:
+            _documents.popitem(last=False)
+    return session
+
+
+_STARTXREF_PATTERN = re.compile(rb"startxref\s+(\d+)")
+_FIRST_OBJECT_PATTERN = re.compile(rb"\d+\s+\d+\s+obj\s*<<(.*?)>>", re.S)
+_XREF_SUBSECTION_PATTERN = re.compile(rb"\s*(\d+)\s+(\d+)[ \t]*(?:\r\n|\r|\n)")
+_TRAILER_PATTERN = re.compile(rb"\s*trailer")
+_OBJECT_HEADER_PATTERN = re.compile(rb"\s*(\d+)\s+(\d+)\s+obj")
+
+
+def quick_page_count(path):
+    """
+    Read the page count from the root /Pages /Count without parsing the
+    document: only the trailer, the cross-reference table entries of the
+    catalog and the page tree root (following /Prev for incremental updates),
+    or the /N of a linearized file, are read. Raises ValueError when the file
+    does not have a readable classic xref table, e.g. cross-reference streams
+    or a broken xref; count_pages then falls back to PyPDF2.
+    """
+    with open(path, "rb") as f:
+        if DOCUMENT_MMAP:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            data = contextlib.nullcontext(_FileBytes(f))
+        with data as m:
+            # A linearized file announces its page count in its first object,
+            # which is only valid while /L still matches the file length
+            match = _FIRST_OBJECT_PATTERN.search(m[:1024])
+            if match and b"/Linearized" in match.group(1):
+                length = re.search(rb"/L\s+(\d+)", match.group(1))
+                pages = re.search(rb"/N\s+(\d+)", match.group(1))
+                if length and pages and int(length.group(1)) == len(m):
+                    return int(pages.group(1))
+
+            sections, root = _read_xref_chain(m)
+            catalog = _read_object(m, sections, root)
+            match = re.search(rb"/Pages\s+(\d+)\s+\d+\s+R", catalog)
+            if not match:
+                raise ValueError("Catalog has no /Pages reference")
+            page_tree = _read_object(m, sections, int(match.group(1)))
+            match = re.search(rb"/Count\s+(\d+)(?!\d)(?!\s+\d+\s+R)", page_tree)
+            if not match:
+                raise ValueError("Page tree has no direct /Count")
+            return int(match.group(1))
+
+
+class _FileBytes:
+    """
+    The slicing, len() and find() of an mmap over an open file, reading only
+    the bytes asked for. Used by quick_page_count when DOCUMENT_MMAP is off.
+    """
+
+    def __init__(self, f):
+        self._file = f
+        self._size = os.fstat(f.fileno()).st_size
+
+    def __len__(self):
+        return self._size
+
+    def __getitem__(self, key):
+        start, stop, _ = key.indices(self._size)
+        self._file.seek(start)
+        return self._file.read(max(0, stop - start))
+
+    def find(self, sub, start=0):
+        chunk_size = 64 * 1024
+        for pos in range(start, self._size, chunk_size):
+            # Overlap the chunks so sub is found across their boundaries too
+            found = self[pos : pos + chunk_size + len(sub) - 1].find(sub)
+            if found != -1:
+                return pos + found
+        return -1
+
+
+def _read_xref_chain(m):
+    """
+    Return the xref sections, newest first, as lists of (first object number,
+    count, offset of the first entry, entry length), and the /Root object number.
+    """
+    matches = list(_STARTXREF_PATTERN.finditer(m[max(0, len(m) - 1024) :]))
+    if not matches:
+        raise ValueError("startxref not found")
+    offset = int(matches[-1].group(1))
+    sections = []
+    root = None
+    seen = set()
+    while offset is not None:
+        if offset in seen or m[offset : offset + 4] != b"xref":
+            raise ValueError("No classic xref table at the startxref offset")
+        seen.add(offset)
+        pos = offset + 4
+        subsections = []
+        while not _TRAILER_PATTERN.match(m[pos : pos + 256]):
+            match = _XREF_SUBSECTION_PATTERN.match(m[pos : pos + 256])
+            if not match:
+                raise ValueError("Malformed xref table")
+            first, count = int(match.group(1)), int(match.group(2))
+            pos += match.end()
+            # Entries are 20 bytes, some writers use a one byte end of line
+            eol = m[pos + 18 : pos + 20]
+            entry_length = 20 if eol in (b" \n", b" \r", b"\r\n") else 19
+            subsections.append((first, count, pos, entry_length))
+            pos += count * entry_length
+        end = m.find(b"startxref", pos)
+        trailer = m[pos : end if end != -1 else pos + 4096]
+        sections.append(subsections)
+        if root is None:
+            match = re.search(rb"/Root\s+(\d+)\s+\d+\s+R", trailer)
+            root = int(match.group(1)) if match else None
+        match = re.search(rb"/Prev\s+(\d+)", trailer)
+        offset = int(match.group(1)) if match else None
+    if root is None:
+        raise ValueError("Trailer has no /Root")
+    return sections, root
+
+
+def _read_object(m, sections, idnum):
+    """Return the raw bytes of object idnum, between "obj" and "endobj"."""
+    for subsections in sections:
+        for first, count, base, entry_length in subsections:
+            if first <= idnum < first + count:
+                start = base + (idnum - first) * entry_length
+                entry = m[start : start + 18]
+                if entry[17:18] != b"n":
+                    raise ValueError(f"Object {idnum} is not in use")
+                offset = int(entry[:10])
+                match = _OBJECT_HEADER_PATTERN.match(m[offset : offset + 256])
+                if not match or int(match.group(1)) != idnum:
+                    raise ValueError(f"xref offset of object {idnum} is wrong")
+                start = offset + match.end()
+                end = m.find(b"endobj", start)
+                if end == -1:
+                    raise ValueError(f"Object {idnum} is not terminated")
+                return m[start:end]
+    raise ValueError(f"Object {idnum} is not in the xref table")
+
+
+def count_pages(path):
+    """
+    Number of pages of the PDF at path, read with quick_page_count when possible.
+    Otherwise, e.g. for cross-reference streams, PyPDF2 reads the xref and the
+    root /Pages /Count, and only if that fails too is the page tree walked.
+    """
+    try:
+        with instrumentation.stage("page_count", path=path, quick=True):
+            return quick_page_count(path)
+    except ValueError:
+        pass
+    document = open_document(path)
+    try:
+        with document.lock, instrumentation.stage("page_count", path=path, quick=False):
+            count = document.reader.trailer["/Root"]["/Pages"]["/Count"]
+            if isinstance(count, int) and count >= 0:
+                return int(count)
+    except Exception:
+        pass  # Broken xref or page tree root, PyPDF2 repairs what it can
+    return document.page_count
+
+
+class ExtractionCancelled(Exception):
+    """Raised when an extraction is cancelled before its output was written."""
+
+
+def build_writer(document, page_indices, progress=None, cancel_event=None, writer=None):
+    """
+    Return a PdfWriter holding the given 0-based pages of a DocumentSession,
+    appended to `writer` if one is given. progress(done, total) is called after
+    each page is added.
+    """
+    total = len(page_indices)
+    writer = writer or PyPDF2.PdfWriter()
+    with document.lock, instrumentation.stage("build", pages=total):
+        for done, p in enumerate(page_indices, 1):
+            if cancel_event is not None and cancel_event.is_set():
+                raise ExtractionCancelled()
+            writer.add_page(document.reader.pages[p])
+            if progress:
+                progress(done, total)
+    return writer
+
+
+@contextlib.contextmanager
+def _atomic_output(output_path):
+    """
+    Yield a binary file that replaces output_path once the block completes. It is
+    a temporary file next to output_path until then, and is deleted if the block
+    raises, so a failed or cancelled write never leaves a partial file.
+    """
+    output_path = os.path.abspath(output_path)
+    fd, tmp_path = tempfile.mkstemp(
+        prefix=".", suffix=".pdf.tmp", dir=os.path.dirname(output_path)
+    )
+    try:
+        with os.fdopen(fd, "wb") as out_f:
+            yield out_f
+        os.chmod(tmp_path, 0o666 & ~_UMASK)  # mkstemp creates files as 0600
+        os.replace(tmp_path, output_path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def write_atomically(writer, output_path, cancel_event=None):
+    """Write a PdfWriter to output_path through _atomic_output."""
+    with instrumentation.stage("write", path=output_path) as record, _atomic_output(
+        output_path
+    ) as out_f:
+        writer.write(out_f)
+        record["bytes"] = out_f.tell()
+        if cancel_event is not None and cancel_event.is_set():
+            raise ExtractionCancelled()
+
+
+def _pdf_object_digest(obj, canonical, data_digests):
+    """
+    Hash an indirect object's content, with its references to other objects
+    replaced by their canonical (deduplicated) object numbers.
+    """
+    digest = hashlib.blake2b(digest_size=20)
+    stack = [obj]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, generic.IndirectObject):
+            digest.update(b"R%d;" % canonical.get(item.idnum, item.idnum))
+        elif isinstance(item, generic.DictionaryObject):
+            digest.update(b"<<%d;" % len(item))
+            for key, value in sorted(dict.items(item), reverse=True):
+                stack.append(value)
+                stack.append(key)
+            if isinstance(item, generic.StreamObject):
+                # Stream data never changes during deduplication, hash it once
+                data_key = id(item)
+                if data_key not in data_digests:
+                    data_digests[data_key] = hashlib.blake2b(
+                        item._data or b"", digest_size=20
+                    ).digest()
+                digest.update(b"stream" + data_digests[data_key])
+        elif isinstance(item, generic.ArrayObject):
+            digest.update(b"[%d;" % len(item))
+            stack.extend(reversed(list(item)))
+        else:
+            buf = io.BytesIO()
+            item.write_to_stream(buf, None)
+            digest.update(type(item).__name__.encode() + b":" + buf.getvalue() + b";")
+    return digest.digest()
+
+
+def optimize_writer(writer, recompress=False):
+    """
+    Shrink a PdfWriter's output before it is written:
+    - identical objects (fonts, images, content streams...) are merged into one,
+      so repeated pages and repeated resources are stored once
+    - objects no longer reachable from the document are dropped
+    - with recompress=True, streams stored without any filter are Flate compressed
+    Objects are renumbered, so call this after the last page was added.
+    """
+    with instrumentation.stage("optimize", objects=len(writer._objects)):
+        _optimize_writer(writer, recompress)
+
+
+def _optimize_writer(writer, recompress):
+    # Bring every referenced object into the writer, as write() would
+    if not writer._root:
+        writer._root = writer._add_object(writer._root_object)
+    writer._sweep_indirect_references(writer._root)
+    objects = writer._objects
+
+    if recompress:
+        for i, obj in enumerate(objects):
+            if isinstance(obj, generic.StreamObject) and "/Filter" not in obj and obj._data:
+                compressed = generic.EncodedStreamObject()
+                for key, value in dict.items(obj):
+                    if key not in ("/Length", "/DecodeParms"):
+                        compressed[key] = value
+                compressed[generic.NameObject("/Filter")] = generic.NameObject("/FlateDecode")
+                compressed._data = zlib.compress(obj._data)
+                if len(compressed._data) < len(obj._data):
+                    objects[i] = compressed
+
+    roots = [writer._root, writer._info, getattr(writer, "_encrypt", None)]
+    roots = [ref for ref in roots if ref is not None]
+    protected = {ref.idnum for ref in roots}
+
+    # Merge identical objects until nothing changes: once children are merged,
+    # their parents may become identical too. Page tree nodes stay distinct,
+    # a page object may only appear once in the tree.
+    canonical = {}  # object number -> number of the identical object kept
+    data_digests = {}
+    changed = True
+    while changed:
+        changed = False
+        seen = {}
+        for idnum, obj in enumerate(objects, 1):
+            if obj is None or idnum in canonical or idnum in protected:
+                continue
+            if isinstance(obj, generic.DictionaryObject) and dict.get(obj, "/Type") in (
+                "/Page",
+                "/Pages",
+                "/Catalog",
+            ):
+                continue
+            key = _pdf_object_digest(obj, canonical, data_digests)
+            if key in seen:
+                canonical[idnum] = seen[key]
+                changed = True
+            else:
+                seen[key] = idnum
+
+    # Keep only what is reachable from the trailer, following merged references
+    reachable = set()
+    stack = [ref.idnum for ref in roots]
+    while stack:
+        idnum = stack.pop()
+        idnum = canonical.get(idnum, idnum)
+        if idnum in reachable:
+            continue
+        reachable.add(idnum)
+        items = [objects[idnum - 1]]
+        while items:
+            item = items.pop()
+            if isinstance(item, generic.IndirectObject):
+                stack.append(item.idnum)
+            elif isinstance(item, generic.DictionaryObject):
+                items.extend(dict.values(item))
+            elif isinstance(item, generic.ArrayObject):
+                items.extend(list(item))
+
+    # Renumber the survivors densely and point every reference at them
+    new_ids = {}
+    for idnum in range(1, len(objects) + 1):
+        if idnum in reachable:
+            new_ids[idnum] = len(new_ids) + 1
+
+    def new_ref(ref):
+        return generic.IndirectObject(new_ids[canonical.get(ref.idnum, ref.idnum)], 0, writer)
+
+    visited = set()
+    new_objects = []
+    for idnum, obj in enumerate(objects, 1):
+        if idnum not in new_ids:
+            continue
+        if obj is None:
+            obj = generic.NullObject()
+        obj.indirect_reference = generic.IndirectObject(new_ids[idnum], 0, writer)
+        new_objects.append(obj)
+        items = [obj]
+        while items:
+            item = items.pop()
+            if id(item) in visited:
+                continue
+            visited.add(id(item))
+            if isinstance(item, generic.DictionaryObject):
+                for key, value in list(dict.items(item)):
+                    if isinstance(value, generic.IndirectObject):
+                        dict.__setitem__(item, key, new_ref(value))
+                    else:
+                        items.append(value)
+            elif isinstance(item, generic.ArrayObject):
+                for i, value in enumerate(list(item)):
+                    if isinstance(value, generic.IndirectObject):
+                        list.__setitem__(item, i, new_ref(value))
+                    else:
+                        items.append(value)
+
+    writer._objects = new_objects
+    for attr in ("_root", "_pages", "_info", "_encrypt"):
+        if getattr(writer, attr, None) is not None:
+            setattr(writer, attr, new_ref(getattr(writer, attr)))
+    # These caches hold old object numbers
+    writer._id_translated = {}
+    writer._idnum_hash = {}
+
+
+class StreamingPdfWriter:
+    """
+    PDF writer for very large extractions. Each page and the objects it uses are
+    serialized to the output as soon as the page is added, so only byte offsets
+    and a map of already written objects stay in memory. close() then writes the
+    page tree, catalog, xref table and trailer.
+    Objects shared between pages (fonts, repeated pages' content) are written
+    once, and so are identical streams without references (font files, images),
+    even when they come from different input files. References from a page to
+    other pages, e.g. in link annotations, point to the copy already written,
+    or become null for pages not (yet) written.
+    """
+
+    _CATALOG = 1
+    _PAGES = 2
+
+    def __init__(self, stream):
+        self.stream = stream
+        self._offsets = {}  # output object number -> byte offset
+        self._next_number = 3
+        self._kids = []  # object numbers of the written pages, in order
+        self._translated = {}  # (id(reader), idnum, generation) -> object number
+        self._source_pages = {}  # (id(reader), idnum) of a page -> its first copy
+        self._readers = []  # Keeps readers alive so their id() stays unique
+        self._streams = {}  # digest of a reference free stream -> object number
+        stream.write(b"%PDF-1.7\n%\xe2\xe3\xcf\xd3\n")
+
+    def add_page(self, page):
+        """Write a page of a PdfReader and everything it references."""
+        number = self._allocate()
+        self._kids.append(number)
+        reader = page.pdf
+        if reader not in self._readers:
+            self._readers.append(reader)
+        if page.indirect_reference is not None:
+            self._source_pages.setdefault(
+                (id(reader), page.indirect_reference.idnum), number
+            )
+
+        pending = []
+        self._begin_object(number)
+        self.stream.write(b"<<\n/Parent %d 0 R\n" % self._PAGES)
+        for key, value in dict.items(page):
+            if key in ("/Parent", "/StructParents"):
+                continue
+            key.write_to_stream(self.stream, None)
+            self.stream.write(b" ")
+            self._write_value(value, pending)
+            self.stream.write(b"\n")
+        self.stream.write(b">>")
+        self._end_object()
+
+        while pending:
+            number, obj, source = pending.pop()
+            self._write_object(number, obj, pending)
+            # Let the reader forget large objects once they are on disk; they
+            # are re-read if another page needs them (they keep their number)
+            if source is not None and isinstance(obj, generic.StreamObject):
+                source.pdf.resolved_objects.pop((source.generation, source.idnum), None)
+
+    def close(self):
+        """Write the page tree, catalog, xref table and trailer."""
+        out = self.stream
+        self._begin_object(self._PAGES)
+        out.write(b"<< /Type /Pages /Count %d /Kids [" % len(self._kids))
+        for i, kid in enumerate(self._kids):
+            out.write(b"%s%d 0 R" % (b"\n" if i % 10 == 0 else b" ", kid))
+        out.write(b" ] >>")
+        self._end_object()
+        self._begin_object(self._CATALOG)
+        out.write(b"<< /Type /Catalog /Pages %d 0 R >>" % self._PAGES)
+        self._end_object()
+
+        xref_offset = out.tell()
+        out.write(b"xref\n0 %d\n0000000000 65535 f \n" % self._next_number)
+        for number in range(1, self._next_number):
+            out.write(b"%010d 00000 n \n" % self._offsets[number])
+        out.write(
+            b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n"
+            % (self._next_number, self._CATALOG, xref_offset)
+        )
+
+    def _allocate(self):
+        number = self._next_number
+        self._next_number += 1
+        return number
+
+    def _begin_object(self, number):
+        self._offsets[number] = self.stream.tell()
+        self.stream.write(b"%d 0 obj\n" % number)
+
+    def _end_object(self):
+        self.stream.write(b"\nendobj\n")
+
+    def _write_object(self, number, obj, pending):
+        self._begin_object(number)
+        if isinstance(obj, generic.StreamObject):
+            data = obj._data or b""
+            if isinstance(data, str):
+                data = data.encode("latin-1")
+            self.stream.write(b"<<\n/Length %d\n" % len(data))
+            for key, value in dict.items(obj):
+                if key == "/Length":
+                    continue
+                key.write_to_stream(self.stream, None)
+                self.stream.write(b" ")
+                self._write_value(value, pending)
+                self.stream.write(b"\n")
+            self.stream.write(b">>\nstream\n")
+            self.stream.write(data)
+            self.stream.write(b"\nendstream")
+        else:
+            self._write_value(obj, pending)
+        self._end_object()
+
+    def _write_value(self, value, pending):
+        out = self.stream
+        if isinstance(value, generic.IndirectObject):
+            number = self._reference(value, pending)
+            out.write(b"null" if number is None else b"%d 0 R" % number)
+        elif isinstance(value, generic.StreamObject):
+            # Streams must be indirect objects, even if the input inlined one
+            number = self._allocate()
+            pending.append((number, value, None))
+            out.write(b"%d 0 R" % number)
+        elif isinstance(value, generic.DictionaryObject):
+            out.write(b"<<\n")
+            for key, item in dict.items(value):
+                key.write_to_stream(out, None)
+                out.write(b" ")
+                self._write_value(item, pending)
+                out.write(b"\n")
+            out.write(b">>")
+        elif isinstance(value, generic.ArrayObject):
+            out.write(b"[")
+            for item in list.__iter__(value):
+                out.write(b" ")
+                self._write_value(item, pending)
+            out.write(b" ]")
+        else:
+            value.write_to_stream(out, None)
+
+    def _reference(self, ref, pending):
+        """Output object number for a reference into a reader, or None for null."""
+        key = (id(ref.pdf), ref.idnum, ref.generation)
+        number = self._translated.get(key)
+        if number is not None:
+            return number
+        obj = ref.get_object()
+        if obj is None or isinstance(obj, generic.NullObject):
+            return None
+        if isinstance(obj, generic.DictionaryObject):
+            # Never pull in the input's page tree through a stray reference
+            obj_type = dict.get(obj, "/Type")
+            if obj_type == "/Page":
+                return self._source_pages.get((id(ref.pdf), ref.idnum))
+            if obj_type == "/Pages":
+                return self._PAGES
+            if obj_type == "/Catalog":
+                return None
+        digest = None
+        if isinstance(obj, generic.StreamObject) and not _contains_reference(obj):
+            digest = _pdf_object_digest(obj, {}, {})
+            number = self._streams.get(digest)
+            if number is not None:
+                self._translated[key] = number
+                return number
+        number = self._allocate()
+        self._translated[key] = number
+        if digest is not None:
+            self._streams[digest] = number
+        pending.append((number, obj, ref))
+        return number
+
+
+def _contains_reference(obj):
+    """True if a PDF object refers to another object anywhere inside it."""
+    stack = [obj]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, generic.IndirectObject):
+            return True
+        if isinstance(item, generic.DictionaryObject):
+            stack.extend(dict.values(item))
+        elif isinstance(item, generic.ArrayObject):
+            stack.extend(list.__iter__(item))
+    return False
+
+
+def extract_streaming(parts, output_path, progress=None, cancel_event=None):
+    """
+    Like extract_many, but with a StreamingPdfWriter: pages are written to the
+    (temporary) output file as they are added, so peak memory stays around one
+    page's resources however many pages are extracted.
+    """
+    total = sum(len(page_indices) for _, page_indices in parts)
+    with instrumentation.stage(
+        "write", path=output_path, pages=total, streaming=True
+    ) as record, _atomic_output(output_path) as out_f:
+        writer = StreamingPdfWriter(out_f)
+        done = 0
+        for document, page_indices in parts:
+            with document.lock:
+                for p in page_indices:
+                    if cancel_event is not None and cancel_event.is_set():
+                        raise ExtractionCancelled()
+                    writer.add_page(document.reader.pages[p])
+                    done += 1
+                    if progress:
+                        progress(done, total)
+        writer.close()
+        record["bytes"] = out_f.tell()
+        if cancel_event is not None and cancel_event.is_set():
+            raise ExtractionCancelled()
+
+
+def extract_to_file(
+    document,
+    page_indices,
+    output_path,
+    progress=None,
+    cancel_event=None,
+    compress=False,
+    streaming=None,
+):
+    """
+    Write the given 0-based pages of a DocumentSession to a new PDF, see
+    build_writer, optimize_writer and write_atomically. With streaming=True the
+    pages are written by extract_streaming instead (without optimize_writer);
+    the default None picks streaming for inputs of STREAMING_EXTRACT_BYTES or more.
+    """
+    extract_many(
+        [(document, page_indices)],
+        output_path,
+        progress,
+        cancel_event,
+        compress,
+        streaming,
+    )
+
+
+def extract_many(
+    parts,
+    output_path,
+    progress=None,
+    cancel_event=None,
+    compress=False,
+    streaming=None,
+):
+    """
+    Write the pages of several inputs, in order, to one new PDF. parts is a list
+    of (DocumentSession, 0-based page indices) pairs; otherwise the same as
+    extract_to_file, with streaming picked by the total size of the inputs.
+    Fonts, images and other resources shared by the inputs are stored once.
+    """
+    if streaming is None:
+        inputs = {id(document): document for document, _ in parts}.values()
+        streaming = sum(d.version[0] for d in inputs) >= STREAMING_EXTRACT_BYTES
+    if streaming:
+        extract_streaming(parts, output_path, progress, cancel_event)
+        return
+    total = sum(len(page_indices) for _, page_indices in parts)
+    writer = PyPDF2.PdfWriter()
+    offset = 0
+    for document, page_indices in parts:
+
+        def part_progress(done, _, offset=offset):
+            if progress:
+                progress(offset + done, total)
+
+        build_writer(document, page_indices, part_progress, cancel_event, writer)
+        offset += len(page_indices)
+    # add_page copied everything it needs, so the documents are free again here
+    optimize_writer(writer, recompress=compress)
+    write_atomically(writer, output_path, cancel_event)
+
+
+def split_every(total_pages, every):
+    """Split a document into PageSelections of `every` consecutive pages."""
+    if every < 1:
+        raise ValueError("Pages per part must be at least 1")
+    return [
+        PageSelection([range(start, min(start + every, total_pages))])
+        for start in range(0, total_pages, every)
+    ]
+
+
+def split_by_bookmarks(document):
+    """
+    Split a document at its top-level bookmarks. Returns (title, PageSelection)
+    pairs; each part runs from its bookmark's page up to the next bookmark, and
+    the first part also takes any pages before the first bookmark.
+    """
+    with document.lock:
+        reader = document.reader
+        starts = []
+        for item in reader.outline:
+            if isinstance(item, list):  # Nested children of the previous item
+                continue
+            page = reader.get_destination_page_number(item)
+            if page is not None and page >= 0:
+                starts.append((page, str(item.title)))
+        total_pages = document.page_count
+    if not starts:
+        raise ValueError("The document has no bookmarks")
+    starts.sort(key=lambda start: start[0])
+    parts = []
+    for i, (page, title) in enumerate(starts):
+        first = 0 if i == 0 else page
+        last = starts[i + 1][0] if i + 1 < len(starts) else total_pages
+        if last > first:  # Several bookmarks on one page only produce one part
+            parts.append((title, PageSelection([range(first, last)])))
+    return parts
+
+
+def _init_split_worker(use_mmap):
+    """Start a split_pdf worker process with the parent's DOCUMENT_MMAP."""
+    global DOCUMENT_MMAP
+    DOCUMENT_MMAP = use_mmap
+
+
+def _write_part(path, pages, output_path, compress):
+    """
+    Write one split output from the PDF at path; run in split_pdf's worker
+    processes, which each parse the input once through open_document.
+    """
+    document = open_document(path)
+    with document.lock:
+        writer = build_writer(document, pages)
+    optimize_writer(writer, recompress=compress)
+    write_atomically(writer, output_path)
+    return output_path, len(pages)
+
+
+def split_pdf(document, parts, workers=1, progress=None, compress=False):
+    """
+    Write many outputs from one parsed document in a single pass.
+    parts is a list of (PageSelection, output_path) pairs; output paths must be
+    distinct. With workers > 1 the parts are written by that many processes,
+    each parsing the input once. progress(output_path, pages) is called as each
+    output is written, and compress is passed on to optimize_writer. Returns
+    the number of pages written in total.
+    """
+    seen = set()
+    for _, output_path in parts:
+        key = os.path.normcase(os.path.abspath(output_path))
+        if key in seen:
+            raise ValueError(f"{output_path} would be written more than once")
+        seen.add(key)
+
+    workers = max(1, min(workers, len(parts)))
+    total = 0
+    if workers == 1:
+        for pages, output_path in parts:
+            with document.lock:
+                writer = build_writer(document, pages)
+            optimize_writer(writer, recompress=compress)
+            write_atomically(writer, output_path)
+            if progress:
+                progress(output_path, len(pages))
+            total += len(pages)
+        return total
+    # Writing is pure Python, threads would only take turns holding the GIL
+    import multiprocessing  # Deferred, see run_batch
+    from concurrent.futures import ProcessPoolExecutor
+
+    # Spawned, not forked: a forked worker would inherit the parent's cached
+    # DocumentSession and share its file offset with the other workers
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_split_worker,
+        initargs=(DOCUMENT_MMAP,),
+    ) as pool:
+        futures = [
+            pool.submit(_write_part, document.path, pages, output_path, compress)
+            for pages, output_path in parts
+        ]
+        for future in as_completed(futures):
+            output_path, pages = future.result()
+            if progress:
+                progress(output_path, pages)
+            total += pages
+    return total
+
+
+def slice_pdf(
+    input_path,
+    selection_str,
+    output_path,
+    progress=None,
+    cancel_event=None,
+    compress=False,
+    streaming=None,
+):
+    """
+    Extract a page selection from input_path into output_path, the headless
+    equivalent of the Extract button. Returns the number of pages written.
+    """
+    document = open_document(input_path)
+    with document.lock:
+        pages = parse_page_selection(selection_str, document.page_count, document.path)
+    if not pages:
+        raise ValueError("No pages selected")
+    extract_to_file(
+        document,
+        pages,
+        output_path,
+        progress=progress,
+        cancel_event=cancel_event,
+        compress=compress,
+        streaming=streaming,
+    )
+    return len(pages)
+
+
+_INPUT_PART_PATTERN = re.compile(r"^(.+?\.pdf)\s*(?::(.*))?$", re.I | re.S)
+
+
+def parse_multi_selection(selection_str, base_dir=None):
+    """
+    Split a selection over several input files into (path, selection) pairs.
+    Each part may start with "file.pdf:"; parts without a file continue the
+    previous one, and a bare "file.pdf" stands for all of its pages. Relative
+    paths are relative to base_dir (default: the current directory).
+    Example input: "a.pdf:1-3, 5, b.pdf:7, a.pdf"
+    Returns: [("a.pdf", "1-3, 5"), ("b.pdf", "7"), ("a.pdf", "1-")]
+    """
+    groups = []
+    for part in _SELECTION_PART_PATTERN.findall(selection_str):
+        part = part.strip()
+        if not part:
+            continue
+        # text:"... .pdf" is a query, not a file, but textbook.pdf is a file
+        match = not _TEXT_QUERY_PATTERN.match(part) and _INPUT_PART_PATTERN.match(part)
+        if match:
+            path = os.path.join(base_dir or "", match.group(1).strip())
+            groups.append((path, (match.group(2) or "").strip() or "1-"))
+        elif groups:
+            path, previous = groups[-1]
+            groups[-1] = (path, f"{previous}, {part}")
+        else:
+            raise ValueError(f"No input file given for: {part}")
+    return groups
+
+
+def merge_pdfs(
+    selection_str,
+    output_path,
+    workers=None,
+    progress=None,
+    cancel_event=None,
+    compress=False,
+    streaming=None,
+    base_dir=None,
+):
+    """
+    Extract pages from several PDFs into one, e.g. "a.pdf:1-3, b.pdf:7" (see
+    parse_multi_selection). The inputs are opened and parsed concurrently on
+    up to `workers` threads, then their pages are written in the requested
+    order by extract_many. Returns the number of pages written.
+    """
+    groups = parse_multi_selection(selection_str, base_dir)
+    paths = list(dict.fromkeys(path for path, _ in groups))
+
+    def open_and_count(path):
+        document = open_document(path)
+        document.page_count  # Parse the page tree here, in parallel
+        return document
+
+    with instrumentation.stage("open_inputs", inputs=len(paths)):
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            documents = dict(zip(paths, pool.map(open_and_count, paths)))
+
+    parts = []
+    for path, part in groups:
+        document = documents[path]
+        try:
+            with document.lock:
+                pages = parse_page_selection(part, document.page_count, document.path)
+        except ValueError as e:
+            raise ValueError(f"{os.path.basename(path)}: {e}")
+        parts.append((document, pages))
+    total = sum(len(pages) for _, pages in parts)
+    if not total:
+        raise ValueError("No pages selected")
+    extract_many(parts, output_path, progress, cancel_event, compress, streaming)
+    return total
+
+
+class TextIndex:
+    """
+    The text of every page of one document, normalized for searching: case
+    folded, with every run of whitespace collapsed into one space, so queries
+    also match across line breaks.
+    """
+
+    def __init__(self, pages):
+        self.pages = pages
+
+    @staticmethod
+    def normalize(text):
+        return " ".join(text.split()).casefold()
+
+    def find(self, query):
+        """0-based indices of the pages containing query, ignoring case."""
+        query = self.normalize(query)
+        with instrumentation.stage("search", pages=len(self.pages)):
+            return [i for i, text in enumerate(self.pages) if query in text]
+
+
+def extract_page_texts(path, start, stop, use_mmap=True):
+    """
+    Normalized text of pages start..stop-1 (0-based) of the PDF at path; a page
+    whose text cannot be extracted counts as empty. Runs in index processes.
+    """
+    document = DocumentSession(path, use_mmap)
+    try:
+        pages = document.reader.pages
+        texts = []
+        for i in range(start, min(stop, len(pages))):
+            try:
+                texts.append(TextIndex.normalize(pages[i].extract_text()))
+            except Exception:
+                texts.append("")
+        return texts
+    finally:
+        document.close()
+
+
+def build_text_index(path, workers=None):
+    """
+    Extract the text of every page of the PDF at path. PyPDF2 is pure Python,
+    so large documents are split across up to `workers` processes.
+    """
+    import multiprocessing  # Deferred, see run_batch
+
+    total = count_pages(path)
+    workers = max(1, min(workers or PREVIEW_WORKERS, -(-total // TEXT_INDEX_CHUNK_PAGES)))
+    with instrumentation.stage("index", path=path, pages=total, workers=workers):
+        if workers == 1:
+            return extract_page_texts(path, 0, total, DOCUMENT_MMAP)
+        # Spawned processes do not see DOCUMENT_MMAP changed at run time
+        bounds = [
+            (path, total * i // workers, total * (i + 1) // workers, DOCUMENT_MMAP)
+            for i in range(workers)
+        ]
+        # Spawned, not forked: forking a process with GUI and render threads
+        # can copy locks in a held state. Pool workers also stop with the app.
+        with multiprocessing.get_context("spawn").Pool(workers) as pool:
+            parts = pool.starmap(extract_page_texts, bounds)
+        return [text for part in parts for text in part]
+
+
+_text_indexes = OrderedDict()  # fingerprint -> TextIndex, oldest first
+_text_index_locks = {}  # fingerprint -> Lock held while loading or building
+_text_indexes_lock = threading.Lock()
+
+
+def text_index(path, directory=TEXT_INDEX_DIR, workers=None):
+    """
+    The TextIndex of the PDF at path, built once per file content: kept in
+    memory for the last DOCUMENT_CACHE_SIZE documents and on disk as gzipped
+    JSON named after the file fingerprint. Concurrent callers share one build,
+    which uses `workers` processes as in build_text_index.
+    """
+    fingerprint = file_fingerprint(path)
+    with _text_indexes_lock:
+        lock = _text_index_locks.setdefault(fingerprint, threading.Lock())
+    with lock:
+        with _text_indexes_lock:
+            if fingerprint in _text_indexes:
+                _text_indexes.move_to_end(fingerprint)
+                return _text_indexes[fingerprint]
+        cache_path = os.path.join(directory, fingerprint + ".json.gz")
+        try:
+            with instrumentation.stage("index_read", path=path):
+                with gzip.open(cache_path, "rt", encoding="utf-8") as f:
+                    pages = json.load(f)
+        except (OSError, ValueError):
+            pages = build_text_index(path, workers)
+            try:
+                os.makedirs(directory, exist_ok=True)
+                tmp_path = f"{cache_path}.{threading.get_ident()}.tmp"
+                with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+                    json.dump(pages, f)
+                os.replace(tmp_path, cache_path)
+            except OSError:
+                pass  # The disk cache is best effort
+        index = TextIndex(pages)
+        with _text_indexes_lock:
+            _text_indexes[fingerprint] = index
+            while len(_text_indexes) > DOCUMENT_CACHE_SIZE:
+                _text_indexes.popitem(last=False)
+    return index
+
+
+class ThumbnailCache:
+    """
+    Two-level cache of rendered preview pages keyed by (file fingerprint, page
+    number, width): an in-memory LRU in front of PNG files on disk. Pages are
+    kept PNG compressed in memory too, which for mostly white pages is a small
+    fraction of the bitmap. Both levels are size bounded and evict the least
+    recently used entries first.
+    """
+
+    def __init__(
+        self,
+        directory=THUMBNAIL_CACHE_DIR,
+        memory_bytes=THUMBNAIL_CACHE_MEMORY_BYTES,
+        disk_bytes=THUMBNAIL_CACHE_DISK_BYTES,
+    ):
+        self.directory = directory
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self._memory = OrderedDict()  # key -> PNG bytes, oldest first
+        self._memory_used = 0
+        self._disk_used = None  # Scanned lazily on the first write
+        self._lock = threading.Lock()
+
+    def _path(self, fingerprint, page_number, width):
+        return os.path.join(
+            self.directory, fingerprint, f"p{page_number}-w{width}.png"
+        )
+
+    def get(self, fingerprint, page_number, width):
+        """Return the cached image for a page, or None if it was never rendered."""
+        key = (fingerprint, page_number, width)
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+        if data is None:
+            path = self._path(*key)
+            try:
+                with open(path, "rb") as f:
+                    data = f.read()
+                os.utime(path)  # Mark as recently used for disk eviction
+            except OSError:
+                return None
+            self._remember(key, data)
+        try:
+            with Image.open(io.BytesIO(data)) as stored:
+                stored.load()
+                return stored.copy()
+        except (OSError, ValueError):
+            return None
+
+    def put(self, fingerprint, page_number, width, image):
+        """Store a rendered page in memory and on disk."""
+        key = (fingerprint, page_number, width)
+        buffer = io.BytesIO()
+        # Fast compression: rendered pages are mostly flat areas anyway
+        image.save(buffer, "PNG", compress_level=1)
+        data = buffer.getvalue()
+        self._remember(key, data)
+        path = self._path(*key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+            self._account_disk(len(data))
+        except OSError:
+            pass  # The disk cache is best effort; the page is still in memory
+
+    def _remember(self, key, data):
+        with self._lock:
+            if key in self._memory:
+                return
+            self._memory[key] = data
+            self._memory_used += len(data)
+            while self._memory_used > self.memory_bytes and len(self._memory) > 1:
+                _, old = self._memory.popitem(last=False)
+                self._memory_used -= len(old)
+
+    def _account_disk(self, added):
+        with self._lock:
+            if self._disk_used is None:
+                self._disk_used = sum(size for _, size, _ in self._disk_entries())
+            else:
+                self._disk_used += added
+            if self._disk_used <= self.disk_bytes:
+                return
+            # Drop least recently used files until comfortably under the limit
+            for path, size, _ in sorted(self._disk_entries(), key=lambda e: e[2]):
+                if self._disk_used <= self.disk_bytes * 0.9:
+                    break
+                try:
+                    os.remove(path)
+                    self._disk_used -= size
+                except OSError:
+                    pass
+
+    def _disk_entries(self):
+        """Yield (path, size, mtime) for every cached file on disk."""
+        for dirpath, _, filenames in os.walk(self.directory):
+            for name in filenames:
+                path = os.path.join(dirpath, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                yield path, stat.st_size, stat.st_mtime
+
+
+thumbnail_cache = ThumbnailCache()
+
+
+def iter_thumbnails(
+    pdf_path, page_numbers, width=PREVIEW_WIDTH, workers=1, cache=None, job=None
+):
+    """
+    Yield (page_number, image) preview images for the given 1-based pages at
+    the given width. Pages found in the cache are yielded first; only the rest
+    are rendered by poppler, and those are added to the cache. See
+    iter_rendered_pages for `job`.
+    """
+    cache = cache or thumbnail_cache
+    with instrumentation.stage("fingerprint", path=pdf_path):
+        fingerprint = file_fingerprint(pdf_path)
+    to_render = []
+    for p in page_numbers:
+        with instrumentation.stage("cache_read", page=p):
+            image = cache.get(fingerprint, p, width)
+        if image is None:
+            to_render.append(p)
+        else:
+            yield p, image
+    if not to_render:
+        return
+    rendered_pages = iter_rendered_pages(
+        pdf_path, to_render, width=width, workers=workers, job=job
+    )
+    try:
+        for p, image in rendered_pages:
+            with instrumentation.stage("cache_write", page=p):
+                cache.put(fingerprint, p, width, image)
+            yield p, image
+    finally:
+        rendered_pages.close()
+
+
+class PreviewWindow:
+    """
+    Virtualized, scrollable preview window. Only the pages in or near the
+    viewport have canvas items and a PhotoImage; everything else is just a
+    slot in the layout, so memory stays bounded however many pages are selected.
+    """
+
+    HEADER_HEIGHT = 45  # Space above each page for its "Page N" title
+    PAGE_GAP = 10  # Space below each page
+    MARGIN = 20
+
+    def __init__(self, root, memory_budget=PREVIEW_MEMORY_BYTES - THUMBNAIL_CACHE_MEMORY_BYTES):
+        """
+        Open the window right away; pages are added later with set_pages. The
+        images it holds stay within memory_budget bytes, apart from the visible
+        pages, which are always shown.
+        """
+        self.root = root
+        self.memory_budget = memory_budget
+        self.closed = False
+        self.on_close = None  # Called once the window closes, e.g. to stop rendering
+        self.win = tk.Toplevel(root)
+        self.win.title("Preview PDF Pages")
+
+        # Set initial size and allow resizing
+        self.win.geometry("650x850")
+        self.win.minsize(400, 300)
+
+        self.canvas = tk.Canvas(self.win, bg="#e0e0e0", highlightthickness=0)
+        self.canvas.pack(side="left", fill="both", expand=True)
+        self.scrollbar = tk.Scrollbar(
+            self.win, orient="vertical", command=self.canvas.yview
+        )
+        self.scrollbar.pack(side="right", fill="y")
+        self.canvas.configure(yscrollcommand=self._on_view_changed)
+        self.canvas.bind("<Configure>", self._on_canvas_resized)
+
+        self._loading_item = self.canvas.create_text(
+            self.MARGIN,
+            self.MARGIN,
+            anchor="nw",
+            text="Loading preview...",
+            font=("Segoe UI", 12, "italic"),
+            fill="#4f8cff",
+        )
+
+        self._pages = []  # page numbers in display order
+        self._sizes = []  # (width, height) per slot
+        self._tops = []  # canvas y of each slot's title
+        self._slot_of = {}  # page number -> slot index
+        self._x_offset = 0  # shift that centers the pages in the canvas
+        self._live = {}  # slot index -> canvas item ids currently drawn
+        self._photo_images = {}  # slot index -> PhotoImage, kept alive for Tk
+        self._failed = {}  # slot index -> error message
+        self._requested = set()  # slots handed to the renderer, not yet shown
+        self._keep = range(0)  # slots that may hold canvas items and images
+        self._update_pending = False
+
+        # Hand-off of pages to render between the Tk thread and the renderer
+        self._lock = threading.Lock()
+        self._wanted = []
+        self._wake = threading.Event()
+
+        def _on_mousewheel_scroll(event):
+            if event.num == 4: # Linux scroll up
+                self.canvas.yview_scroll(-1, "units")
+            elif event.num == 5: # Linux scroll down
+                self.canvas.yview_scroll(1, "units")
+            else: # Windows/MacOS
+                self.canvas.yview_scroll(int(-1 * (event.delta / 120)), "units")
+
+        def _set_focus_on_enter(event): # Ensure canvas gets focus on mouse enter
+            self.canvas.focus_set()
+
+        self.canvas.bind("<MouseWheel>", _on_mousewheel_scroll)
+        self.canvas.bind("<Button-4>", _on_mousewheel_scroll) # For Linux scroll up
+        self.canvas.bind("<Button-5>", _on_mousewheel_scroll) # For Linux scroll down
+        self.canvas.bind("<Enter>", _set_focus_on_enter) # Added binding for focus on enter
+        self.canvas.focus_set() # Set initial focus
+
+        self.win.protocol("WM_DELETE_WINDOW", self.close)
+        self.win.focus_set()
+
+    def close(self):
+        """Close the window; the renderer sees `closed` and stops."""
+        if not self.closed and self.on_close is not None:
+            self.on_close()
+        self.closed = True
+        self._wake.set()
+        self._photo_images.clear()
+        if self.win.winfo_exists():
+            self.win.destroy()
+
+    def set_pages(self, pages_with_sizes):
+        """Lay out a slot per (page_number, (width, height)) pair."""
+        if self.closed:
+            return
+        self.canvas.delete(self._loading_item)
+        y = 0
+        for slot, (p_num_1_based, size) in enumerate(pages_with_sizes):
+            self._pages.append(p_num_1_based)
+            self._sizes.append(size)
+            self._tops.append(y)
+            self._slot_of[p_num_1_based] = slot
+            y += self.HEADER_HEIGHT + size[1] + self.PAGE_GAP
+        content_width = max(width for width, _ in self._sizes) + 2 * self.MARGIN
+        self.canvas.configure(scrollregion=(0, 0, content_width, y + self.MARGIN))
+        self._on_canvas_resized()
+
+    def take_wanted(self):
+        """
+        Called from the render thread: block until pages near the viewport need
+        rendering and return their numbers, or None once the window is closed.
+        """
+        while True:
+            self._wake.wait()
+            if self.closed:
+                return None
+            with self._lock:
+                wanted, self._wanted = self._wanted, []
+                self._wake.clear()
+            if wanted:
+                return wanted
+
+    def show_page(self, p_num_1_based, pil_image):
+        """Draw a rendered page if its slot is still in or near the viewport."""
+        slot = self._slot_of.get(p_num_1_based)
+        if self.closed or slot is None:
+            return
+        self._requested.discard(slot)
+        if slot not in self._keep:
+            return  # Scrolled away meanwhile; it is re-requested if it comes back
+        try:
+            # Images already arrive at PREVIEW_WIDTH, no resize needed
+            with instrumentation.stage("display", page=p_num_1_based) as record:
+                self._photo_images[slot] = ImageTk.PhotoImage(pil_image)
+                record["bytes"] = pil_image.width * pil_image.height * 4
+        except Exception as img_err:
+            self._failed[slot] = f"Error loading page {p_num_1_based}: {img_err}"
+        self._draw_slot(slot)
+
+    def mark_failed(self, p_num_1_based, message=None):
+        """Show an error in place of a page that could not be rendered."""
+        slot = self._slot_of.get(p_num_1_based)
+        if self.closed or slot is None:
+            return
+        self._requested.discard(slot)
+        self._failed[slot] = message or f"Page {p_num_1_based} could not be rendered."
+        if slot in self._keep:
+            self._draw_slot(slot)
+
+    def _on_view_changed(self, first, last):
+        self.scrollbar.set(first, last)
+        self._schedule_update()
+
+    def _on_canvas_resized(self, event=None):
+        if not self._sizes:
+            return
+        content_width = max(width for width, _ in self._sizes) + 2 * self.MARGIN
+        x_offset = max(0, (self.canvas.winfo_width() - content_width) // 2)
+        if x_offset != self._x_offset:
+            self.canvas.move("all", x_offset - self._x_offset, 0)
+            self._x_offset = x_offset
+        self._schedule_update()
+
+    def _schedule_update(self):
+        # Coalesce the burst of view changes from a scroll into one update
+        if not self._update_pending and not self.closed:
+            self._update_pending = True
+            self.win.after_idle(self._update_viewport)
+
+    def _update_viewport(self):
+        self._update_pending = False
+        if self.closed or not self._tops:
+            return
+        top = self.canvas.canvasy(0)
+        bottom = self.canvas.canvasy(self.canvas.winfo_height())
+        first = max(0, bisect.bisect_right(self._tops, top) - 1)
+        last = max(first, bisect.bisect_left(self._tops, bottom) - 1)
+        # The visible pages plus up to PREVIEW_PAGE_MARGIN on each side, as
+        # long as their images fit in the memory budget
+        budget = self.memory_budget - sum(
+            self._image_bytes(slot) for slot in range(first, last + 1)
+        )
+        low, high = first, last
+        for _ in range(PREVIEW_PAGE_MARGIN):
+            if low > 0 and self._image_bytes(low - 1) <= budget:
+                low -= 1
+                budget -= self._image_bytes(low)
+            if high < len(self._tops) - 1 and self._image_bytes(high + 1) <= budget:
+                high += 1
+                budget -= self._image_bytes(high)
+        keep = range(low, high + 1)
+        # Evict everything that left the neighbourhood of the viewport
+        for slot in [s for s in self._live if s not in keep]:
+            self.canvas.delete(*self._live.pop(slot))
+            self._photo_images.pop(slot, None)
+        self._keep = keep
+
+        # Pages requested earlier but not taken by the renderer yet that have
+        # scrolled out again are dropped; they are re-requested if they return
+        with self._lock:
+            stale = [p for p in self._wanted if self._slot_of[p] not in keep]
+            if stale:
+                self._wanted = [p for p in self._wanted if self._slot_of[p] in keep]
+        for p_num_1_based in stale:
+            self._requested.discard(self._slot_of[p_num_1_based])
+
+        wanted = []
+        for slot in keep:
+            if slot not in self._live:
+                self._draw_slot(slot)
+            if (
+                slot not in self._photo_images
+                and slot not in self._failed
+                and slot not in self._requested
+            ):
+                self._requested.add(slot)
+                wanted.append(self._pages[slot])
+        if wanted:
+            with self._lock:
+                self._wanted.extend(wanted)
+                self._wake.set()
+
+    def _image_bytes(self, slot):
+        # Tk keeps photo images as 32-bit pixels
+        width, height = self._sizes[slot]
+        return width * height * 4
+
+    def _draw_slot(self, slot):
+        """(Re)create the canvas items of one slot: title plus image or placeholder."""
+        self.canvas.delete(*self._live.pop(slot, ()))
+        p_num_1_based = self._pages[slot]
+        width, height = self._sizes[slot]
+        x = self._x_offset + self.MARGIN
+        y = self._tops[slot] + self.HEADER_HEIGHT
+        items = [
+            self.canvas.create_text(
+                x + width // 2,
+                y - 10,
+                anchor="s",
+                text=f"Page {p_num_1_based}",
+                font=("Arial", 14, "bold"),
+            )
+        ]
+        tk_img = self._photo_images.get(slot)
+        if tk_img is not None:
+            items.append(self.canvas.create_image(x, y, anchor="nw", image=tk_img))
+        else:
+            items.append(
+                self.canvas.create_rectangle(
+                    x, y, x + width, y + height, fill="#cfcfcf", outline=""
+                )
+            )
+            items.append(
+                self.canvas.create_text(
+                    x + width // 2,
+                    y + height // 2,
+                    text=self._failed.get(slot, f"Rendering page {p_num_1_based}..."),
+                    font=("Segoe UI", 10, "italic"),
+                    fill="red" if slot in self._failed else "#666",
+                    width=width - 20,
+                )
+            )
+        self._live[slot] = items
 
 
 class PDFExtractor:
@@ -14,6 +2165,9 @@ class PDFExtractor:
         self.input_path = None
         self.output_path = None
         self.page_selection = tk.StringVar()
+        self._extract_cancel = None  # threading.Event of the running extraction
+        self._debug_win = None
+        self._preview = None  # The open PreviewWindow, replaced by each Preview
 
         # Set a modern theme background
         root.configure(bg="#f4f6fa")
@@ -63,7 +2217,7 @@ class PDFExtractor:
         # Move instruction label below the entry box, spanning columns 1-3
         tk.Label(
             root,
-            text="Format: 1, 3-5, 7 (pages start from 1)",
+            text='Format: 1, 3-5, 7, 10-, 1-9:2, odd, even, text:"Invoice" (pages start from 1)',
             fg="#888",
             font=("Segoe UI", 9),
             bg="#f4f6fa",
@@ -91,7 +2245,7 @@ class PDFExtractor:
         # Button frame for better alignment
         btn_frame = tk.Frame(root, bg="#f4f6fa")
         btn_frame.grid(row=4, column=0, columnspan=4, pady=16)
-        tk.Button(
+        self.extract_button = tk.Button(
             btn_frame,
             text="Extract",
             command=self.extract_pages,
@@ -104,7 +2258,8 @@ class PDFExtractor:
             relief="flat",
             width=12,
             height=1,
-        ).pack(side="left", padx=10)
+        )
+        self.extract_button.pack(side="left", padx=10)
         tk.Button(
             btn_frame,
             text="Preview",
@@ -119,12 +2274,31 @@ class PDFExtractor:
             width=12,
             height=1,
         ).pack(side="left", padx=10)
+        self.cancel_button = tk.Button(
+            btn_frame,
+            text="Cancel",
+            command=self.cancel_extraction,
+            font=button_font,
+            bg="#d9534f",
+            fg="white",
+            activebackground="#c9302c",
+            activeforeground="white",
+            bd=0,
+            relief="flat",
+            width=12,
+            height=1,
+            state="disabled",
+        )
+        self.cancel_button.pack(side="left", padx=10)
 
         self.status_label = tk.Label(
             root, text="", font=status_font, bg="#f4f6fa", fg="#d9534f"
         )
         self.status_label.grid(row=5, column=0, columnspan=4, pady=8)
 
+        # Hidden debug panel with the timings of every pipeline stage
+        root.bind("<F12>", self.show_debug_panel)
+
     def select_input(self):
         """Open a dialog to select the input PDF file."""
         self.input_path = filedialog.askopenfilename(filetypes=[("PDF files", "*.pdf")])
@@ -134,14 +2308,32 @@ class PDFExtractor:
             if len(filename) > 20:
                 filename = filename[:17] + "..."
             self.input_label.config(text=filename)
-            # Show valid page range
-            try:
-                with open(self.input_path, "rb") as f:
-                    reader = PyPDF2.PdfReader(f)
-                    total_pages = len(reader.pages)
-                self.page_range_label.config(text=f"Pages: 1 - {total_pages}")
-            except Exception as e:
-                self.page_range_label.config(text=f"Error reading PDF: {str(e)}")
+            # Show valid page range, counted off the Tk thread
+            self.page_range_label.config(text="Pages: counting...")
+            input_path = self.input_path
+
+            def _count_in_background():
+                try:
+                    text = f"Pages: 1 - {count_pages(input_path)}"
+                except Exception as e:
+                    text = f"Error reading PDF: {str(e)}"
+
+                def _show():
+                    # Another file may have been selected in the meantime
+                    if self.input_path == input_path:
+                        self.page_range_label.config(text=text)
+
+                self.root.after(0, _show)
+                if TEXT_INDEX_IN_BACKGROUND:
+                    try:
+                        # Ready for text:"..." selections
+                        text_index(input_path, workers=TEXT_INDEX_BACKGROUND_WORKERS)
+                    except Exception:
+                        pass  # Reported if a text query is actually used
+
+            threading.Thread(
+                target=instrumentation.profiled(_count_in_background), daemon=True
+            ).start()
         else:
             self.input_label.config(text="No file selected")
             self.page_range_label.config(text="")
@@ -175,25 +2367,66 @@ class PDFExtractor:
             self.status_label.config(text="Please enter page selection")
             return
 
-        try:
-            # Open and process the PDF
-            with open(self.input_path, "rb") as f:
-                reader = PyPDF2.PdfReader(f)
-                total_pages = len(reader.pages)
-                pages_to_extract = self.parse_page_selection(selection_str, total_pages)
-                writer = PyPDF2.PdfWriter()
-                # Add each selected page to the new PDF
-                for p in pages_to_extract:
-                    writer.add_page(reader.pages[p])
-                # Save the new PDF
-                with open(self.output_path, "wb") as out_f:
-                    writer.write(out_f)
-            self.status_label.config(text="Done!", fg="green")
-        except Exception as e:
-            self.status_label.config(text=f"Error: {str(e)}", fg="red")
+        input_path = self.input_path
+        output_path = self.output_path
+        cancel_event = threading.Event()
+        self._extract_cancel = cancel_event
+        self.extract_button.config(state="disabled")
+        self.cancel_button.config(state="normal")
+        self.status_label.config(text="Extracting...", fg="#4f8cff")
+
+        def _report_progress(done, total):
+            # Only touch the UI about a hundred times, however large the job
+            if done == total or done % max(1, total // 100) == 0:
+                text = (
+                    f"Extracting page {done}/{total}..."
+                    if done < total
+                    else "Writing output..."
+                )
+                self.root.after(0, lambda: self.status_label.config(text=text))
+
+        def _finish(text, fg):
+            self._extract_cancel = None
+            self.extract_button.config(state="normal")
+            self.cancel_button.config(state="disabled")
+            self.status_label.config(text=text, fg=fg)
+
+        def _extract_in_background():
+            try:
+                # Reuse the document parsed when the file was selected
+                document = open_document(input_path)
+                with document.lock:
+                    pages_to_extract = self.parse_page_selection(
+                        selection_str, document.page_count, document.path
+                    )
+                extract_to_file(
+                    document,
+                    pages_to_extract,
+                    output_path,
+                    progress=_report_progress,
+                    cancel_event=cancel_event,
+                )
+                self.root.after(0, lambda: _finish("Done!", "green"))
+            except ExtractionCancelled:
+                self.root.after(0, lambda: _finish("Extraction cancelled.", "#d9534f"))
+            except Exception as e:
+                # `e` is unbound once the except block ends, format it now
+                message = f"Error: {e}"
+                self.root.after(0, lambda: _finish(message, "red"))
+
+        threading.Thread(
+            target=instrumentation.profiled(_extract_in_background), daemon=True
+        ).start()
+
+    def cancel_extraction(self):
+        """Ask the running extraction to stop; no output file is left behind."""
+        if self._extract_cancel is not None:
+            self._extract_cancel.set()
+            self.cancel_button.config(state="disabled")
+            self.status_label.config(text="Cancelling...", fg="#d9534f")
 
     def preview_pages(self):
-        """Show a preview of the actual PDF pages as images based on the selection, with threading."""
+        """Open a preview window at once and fill in the selected pages as they render."""
         if not self.input_path:
             self.status_label.config(text="Please select input PDF")
             return
@@ -202,368 +2435,844 @@ class PDFExtractor:
             self.status_label.config(text="Please enter page selection")
             return
 
-        # Create loading window
-        loading_win = tk.Toplevel(self.root)
-        loading_win.title("Loading Preview")
-        loading_win.transient(self.root)  # Make it stay on top of root
-        loading_win.grab_set()  # Make it modal
-        loading_win.resizable(False, False)  # Prevent resizing
+        input_path = self.input_path
+        # The newest preview replaces the previous one and stops its rendering
+        if self._preview is not None:
+            self._preview.close()
+        preview = self._preview = PreviewWindow(self.root)
 
-        loading_label = tk.Label(
-            loading_win,
-            text="Loading preview...",
-            font=("Segoe UI", 12, "italic"),
-            fg="#4f8cff",
-            bg="#f4f6fa",
-            pady=40,
-            padx=40,
-        )
-        loading_label.pack(expand=True, fill="both")
+        def _fail(message):
+            preview.close()
+            self.status_label.config(text=message, fg="red")
 
-        animation_chars = ["⢿", "⣻", "⣽", "⣾", "⣷", "⣯", "⣟", "⡿"]
-        animation_idx = 0
-        self._animation_after_id = None  # Store 'after' ID
+        def _process_conversion_and_display(job):
+            try:
+                document = open_document(input_path)
+                with document.lock:
+                    pages_to_extract_indices = self.parse_page_selection(
+                        selection_str, document.page_count, document.path
+                    )
 
-        def update_loading_text():
-            nonlocal animation_idx
-            # Check if the widgets are still valid at the beginning of the call
-            if not loading_win.winfo_exists() or not loading_label.winfo_exists():
-                self._animation_after_id = None # Animation stops if widgets are gone
-                return
+                    if not pages_to_extract_indices:
+                        self.root.after(
+                            0, lambda: _fail("No valid pages selected for preview.")
+                        )
+                        return
 
-            loading_label.config(
-                text=f"Loading preview... {animation_chars[animation_idx % len(animation_chars)]}"
-            )
-            animation_idx += 1
-            
-            # Re-check loading_win's existence immediately before scheduling the next 'after'
-            if loading_win.winfo_exists():
-                self._animation_after_id = loading_win.after(100, update_loading_text)
-            else:
-                # loading_win was destroyed between the outer check and here, or by another thread/event.
-                self._animation_after_id = None 
+                    page_numbers = sorted(
+                        set(p + 1 for p in pages_to_extract_indices)
+                    )  # 1-based, unique, sorted
+                    # Placeholder sizes come from the page boxes, no rendering needed
+                    pages_with_sizes = [
+                        (p, thumbnail_size(document.reader.pages[p - 1]))
+                        for p in page_numbers
+                    ]
 
-        update_loading_text()
-        loading_win.update_idletasks()  # Ensure window is drawn
+                self.root.after(0, lambda: preview.set_pages(pages_with_sizes))
 
-        def _destroy_loading_window():
-            # Attempt to cancel the animation if it's scheduled and loading_win still exists.
-            if self._animation_after_id and loading_win.winfo_exists():
-                try:
-                    loading_win.after_cancel(self._animation_after_id)
-                except tk.TclError:
-                    # This can happen if the ID is no longer valid (e.g., already fired and not rescheduled)
-                    # or if loading_win is in a state where its Tcl command is already gone.
-                    # print(f"DEBUG: TclError cancelling animation_id {self._animation_after_id} for loading_win in _destroy_loading_window")
-                    pass 
-            self._animation_after_id = None # Always clear the ID after attempting/assuming cancellation.
-
-            if loading_win.winfo_exists():
-                try:
-                    loading_win.grab_release()
-                except tk.TclError:
-                    # print(f"DEBUG: TclError releasing grab for loading_win in _destroy_loading_window")
-                    pass # May not have had grab, or window is problematic.
-                
-                try:
-                    # Process any pending Tcl events for loading_win. This might help Tcl
-                    # clean up its internal state regarding commands associated with loading_win.
-                    loading_win.update_idletasks() 
-                    loading_win.destroy() # This is the line from the traceback (pdf_slicer.py:257)
-                except tk.TclError as e:
-                    print(f"ERROR_DEBUG: TclError during loading_win.destroy(): {e}. This occurs after winfo_exists, after_cancel, and update_idletasks.")
-            # else:
-                # print(f"DEBUG: loading_win did not exist at the point of destruction in _destroy_loading_window.")
-
-        def _process_conversion_and_display():
-            try:
-                with open(self.input_path, "rb") as f:
-                    reader = PyPDF2.PdfReader(f)
-                    total_pages = len(reader.pages)
-                    pages_to_extract_indices = self.parse_page_selection(
-                        selection_str, total_pages
-                    )
+                # Render whatever the window asks for as the user scrolls: only
+                # the selected pages near the viewport that are not cached yet,
+                # scaled by poppler straight to the preview width. At most two
+                # images wait in Tk's event queue, so a slow UI pauses rendering
+                # instead of piling up decoded pages.
+                in_flight = threading.BoundedSemaphore(2)
 
-                if not pages_to_extract_indices:
-                    self.root.after(
-                        0,
-                        lambda: [
-                            _destroy_loading_window(),
-                            self.status_label.config(
-                                text="No valid pages selected for preview.", fg="red"
-                            ),
-                        ],
-                    )
-                    return
-
-                number_of_pages = len(pages_to_extract_indices)
-                if number_of_pages >= 30 and number_of_pages <= 50:
-                    self.root.after(
-                        0,
-                        lambda: self.status_label.config(
-                            text="Warning: Preview may take a while for many pages."
-                        ),
-                    )
-                elif number_of_pages > 50:
-                    self.root.after(
-                        0,
-                        lambda: [
-                            _destroy_loading_window(),
-                            self.status_label.config(
-                                text="Too many pages to preview (>50). Please select fewer.",
-                                fg="red",
-                            ),
-                        ],
-                    )
-                    return
-
-                page_numbers_for_pdf2image = sorted(
-                    list(set(p + 1 for p in pages_to_extract_indices))
-                )  # 1-based, unique, sorted
-
-                if not page_numbers_for_pdf2image:  # Should not happen if pages_to_extract_indices is not empty
-                    self.root.after(
-                        0,
-                        lambda: [
-                            _destroy_loading_window(),
-                            self.status_label.config(
-                                text="No pages to render for preview.", fg="red"
-                            ),
-                        ],
+                def _show(p, img):
+                    try:
+                        preview.show_page(p, img)
+                    finally:
+                        in_flight.release()
+
+                while True:
+                    wanted = preview.take_wanted()
+                    if wanted is None:
+                        return
+                    missing = set(wanted)
+                    rendered_pages = iter_thumbnails(
+                        input_path, wanted, workers=PREVIEW_WORKERS, job=job
                     )
-                    return
+                    try:
+                        for p_num_1_based, pil_image in rendered_pages:
+                            if preview.closed or job.cancelled.is_set():
+                                return
+                            missing.discard(p_num_1_based)
+                            while not in_flight.acquire(timeout=0.1):
+                                if preview.closed or job.cancelled.is_set():
+                                    return
+                            self.root.after(0, _show, p_num_1_based, pil_image)
+                    finally:
+                        rendered_pages.close()
+                    if job.cancelled.is_set():
+                        return
+                    for p_num_1_based in missing:
+                        self.root.after(
+                            0, lambda p=p_num_1_based: preview.mark_failed(p)
+                        )
 
-                images_from_pdf = convert_from_path(
-                    self.input_path,
-                    first_page=min(page_numbers_for_pdf2image),
-                    last_page=max(page_numbers_for_pdf2image),
-                    fmt="ppm",
-                )
+            except Exception as e:
+                message = f"Error during preview: {e}"
+                self.root.after(0, lambda: _fail(message))
 
-                if not images_from_pdf:
-                    self.root.after(
-                        0,
-                        lambda: [
-                            _destroy_loading_window(),
-                            self.status_label.config(
-                                text="No images generated from PDF.", fg="red"
-                            ),
-                        ],
-                    )
-                    return
+        job = preview_scheduler.submit(input_path, _process_conversion_and_display)
+        preview.on_close = job.cancel
 
-                # Map the returned images (which are for the whole range) to their 1-based page numbers
-                # in that range.
-                converted_range_page_numbers = list(
-                    range(min(page_numbers_for_pdf2image), max(page_numbers_for_pdf2image) + 1)
-                )
-                page_to_img_map = {
-                    num: img
-                    for num, img in zip(converted_range_page_numbers, images_from_pdf)
-                }
-
-                final_images_to_display = []
-                for p_num_1_based in page_numbers_for_pdf2image:  # Iterate through originally selected pages
-                    img = page_to_img_map.get(p_num_1_based)
-                    if img:
-                        final_images_to_display.append((p_num_1_based, img))
-
-                if not final_images_to_display:
-                    self.root.after(
-                        0,
-                        lambda: [
-                            _destroy_loading_window(),
-                            self.status_label.config(
-                                text="Selected pages could not be rendered.", fg="red"
-                            ),
-                        ],
-                    )
-                    return
+    def show_debug_panel(self, event=None):
+        """Show the per-stage timings collected by `instrumentation` (F12)."""
+        if self._debug_win is not None and self._debug_win.winfo_exists():
+            self._debug_win.lift()
+            return
+        win = tk.Toplevel(self.root)
+        win.title("Pipeline Timings")
+        win.geometry("780x440")
+        win.configure(bg="#f4f6fa")
+        self._debug_win = win
 
-                self.root.after(
-                    0, lambda: _setup_actual_preview_window(final_images_to_display)
-                )
+        text = tk.Text(
+            win, font=("Consolas", 10), wrap="none", bg="white", relief="flat", bd=8
+        )
+        btn_frame = tk.Frame(win, bg="#f4f6fa")
+        btn_frame.pack(side="bottom", fill="x", pady=6)
+        text.pack(side="top", fill="both", expand=True)
 
-            except Exception as e:
-                self.root.after(
-                    0,
-                    lambda: [
-                        _destroy_loading_window(),
-                        self.status_label.config(
-                            text=f"Error during preview: {str(e)}", fg="red"
-                        ),
-                    ],
+        def refresh():
+            lines = [
+                f"{'stage':<14}{'count':>7}{'total s':>10}{'mean ms':>10}"
+                f"{'max ms':>10}{'MB':>10}{'mem MB':>10}"
+            ]
+            for name, total in instrumentation.summary().items():
+                lines.append(
+                    f"{name:<14}{total['count']:>7}{total['seconds']:>10.3f}"
+                    f"{total['seconds'] / total['count'] * 1000:>10.1f}"
+                    f"{total['max_seconds'] * 1000:>10.1f}"
+                    f"{total['bytes'] / 1e6:>10.2f}{total['memory_delta'] / 1e6:>10.2f}"
+                )
+            lines += ["", "Most recent:"]
+            for record in list(instrumentation.records)[-25:][::-1]:
+                details = ", ".join(
+                    f"{key}={value}"
+                    for key, value in record.items()
+                    if key not in ("stage", "seconds", "time", "thread")
                 )
+                lines.append(
+                    f"{record['stage']:<14}{record['seconds'] * 1000:>9.1f} ms  {details}"
+                )
+            if instrumentation.log_path:
+                lines += ["", f"Logging to {instrumentation.log_path}"]
+            text.config(state="normal")
+            text.delete("1.0", "end")
+            text.insert("1.0", "\n".join(lines))
+            text.config(state="disabled")
 
-        def _setup_actual_preview_window(images_with_page_numbers):
-            _destroy_loading_window()
+        def auto_refresh():
+            if win.winfo_exists():
+                refresh()
+                win.after(1000, auto_refresh)
 
-            actual_preview_win = None  # Initialize
-            try:
-                actual_preview_win = tk.Toplevel(self.root)
-                actual_preview_win.title("Preview PDF Pages")
+        def clear():
+            instrumentation.clear()
+            refresh()
 
-                # Set initial size and allow resizing
-                actual_preview_win.geometry("650x850")
-                actual_preview_win.minsize(400, 300)
+        for label, command in (("Refresh", refresh), ("Clear", clear)):
+            tk.Button(
+                btn_frame,
+                text=label,
+                command=command,
+                font=("Segoe UI", 10, "bold"),
+                bg="#4f8cff",
+                fg="white",
+                activebackground="#357ae8",
+                activeforeground="white",
+                bd=0,
+                relief="flat",
+                width=10,
+            ).pack(side="left", padx=8)
+        auto_refresh()
+
+    def parse_page_selection(self, selection_str, total_pages, pdf_path=None):
+        """Parse the page selection string, see the module-level parse_page_selection."""
+        return parse_page_selection(selection_str, total_pages, pdf_path)
+
+
+# Exit codes of the command line interface, also reported per batch job
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_BAD_SELECTION = 2
+
+
+def run_job(input_path, selection_str, output_path, compress=False, streaming=None):
+    """
+    Run one slicing job and return a result dict with its exit code, page and
+    byte counts, duration and error message (if any). Never raises.
+    """
+    result = {
+        "input": input_path,
+        "selection": selection_str,
+        "output": output_path,
+        "exit_code": EXIT_OK,
+        "pages": 0,
+        "bytes": 0,
+        "seconds": 0.0,
+        "error": None,
+    }
+    started = time.perf_counter()
+    try:
+        result["pages"] = slice_pdf(
+            input_path,
+            selection_str,
+            output_path,
+            compress=compress,
+            streaming=streaming,
+        )
+        result["bytes"] = os.path.getsize(output_path)
+    except ValueError as e:
+        result["exit_code"] = EXIT_BAD_SELECTION
+        result["error"] = str(e)
+    except Exception as e:
+        result["exit_code"] = EXIT_FAILED
+        result["error"] = str(e)
+    result["seconds"] = time.perf_counter() - started
+    return result
 
-                canvas = tk.Canvas(actual_preview_win)
-                canvas.pack(side="left", fill="both", expand=True)
-                scrollbar = tk.Scrollbar(
-                    actual_preview_win, orient="vertical", command=canvas.yview
-                )
-                scrollbar.pack(side="right", fill="y")
-                canvas.configure(yscrollcommand=scrollbar.set)
 
-                frame_in_canvas = tk.Frame(canvas, bg="#e0e0e0")
-                # Create the window item ONCE and store its ID
-                frame_in_canvas_id = canvas.create_window(
-                    (0, 0), window=frame_in_canvas, anchor="nw"
+def read_manifest(manifest_path):
+    """
+    Read batch jobs from a CSV file with the columns input, selection, output.
+    Relative paths are taken relative to the manifest. Blank rows and rows
+    whose input starts with '#' are skipped.
+    """
+    base = os.path.dirname(os.path.abspath(manifest_path))
+    jobs = []
+    with open(manifest_path, newline="", encoding="utf-8") as f:
+        for line_no, row in enumerate(csv.DictReader(f), 2):
+            input_path = (row.get("input") or "").strip()
+            if not input_path or input_path.startswith("#"):
+                continue
+            selection_str = (row.get("selection") or "").strip()
+            output_path = (row.get("output") or "").strip()
+            if not selection_str or not output_path:
+                raise ValueError(
+                    f"{manifest_path}:{line_no}: selection and output are required"
+                )
+            jobs.append(
+                (
+                    os.path.join(base, input_path),
+                    selection_str,
+                    os.path.join(base, output_path),
                 )
+            )
+    return jobs
 
-                actual_preview_win._preview_photo_images = []
 
-                # Determine correct resampling filter based on Pillow version
-                try:
-                    resample_filter = Image.Resampling.LANCZOS
-                except AttributeError:
-                    resample_filter = Image.LANCZOS  # Fallback for older Pillow
-
-                if not images_with_page_numbers:
-                    # This case should ideally be caught before calling this function,
-                    # but as a safeguard:
-                    self.status_label.config(text="Preview error: No images to display.", fg="red")
-                    if actual_preview_win and actual_preview_win.winfo_exists():
-                        actual_preview_win.destroy()
-                    return
-
-                for p_num_1_based, pil_image in images_with_page_numbers:
-                    try:
-                        resized_img = pil_image.resize(
-                            (500, int(pil_image.height * 500 / pil_image.width)),
-                            resample_filter,
-                        )
-                        tk_img = ImageTk.PhotoImage(resized_img)
-                        actual_preview_win._preview_photo_images.append(tk_img)
-
-                        page_label = tk.Label(
-                            frame_in_canvas,
-                            text=f"Page {p_num_1_based}",
-                            font=("Arial", 14, "bold"),
-                            bg=frame_in_canvas.cget("bg"),
-                        )
-                        page_label.pack(pady=(20, 5))
+def run_batch(jobs, workers=None, compress=False, streaming=None):
+    """
+    Run (input, selection, output) jobs concurrently in worker processes and
+    yield each job's result dict as it completes.
+    """
+    workers = max(1, min(workers or os.cpu_count() or 1, len(jobs)))
+    if workers == 1:
+        for job in jobs:
+            yield run_job(*job, compress=compress, streaming=streaming)
+        return
+    # PyPDF2 is pure Python, so processes rather than threads use every core
+    # Imported here, multiprocessing adds noticeably to the GUI startup time
+    from concurrent.futures import ProcessPoolExecutor
 
-                        img_display_label = tk.Label(
-                            frame_in_canvas,
-                            image=tk_img,
-                            bg=frame_in_canvas.cget("bg"),
-                        )
-                        img_display_label.pack(pady=(0, 10))
-                    except Exception as img_err:
-                        error_label = tk.Label(
-                            frame_in_canvas,
-                            text=f"Error loading page {p_num_1_based}: {img_err}",
-                            fg="red",
-                            bg=frame_in_canvas.cget("bg"),
-                        )
-                        error_label.pack(pady=(20, 10))
-                
-                # This function is called when frame_in_canvas's size changes
-                def on_frame_configure(event):
-                    canvas.configure(scrollregion=canvas.bbox("all"))
-                    # Optional: Make the frame width match the canvas width if you don't want horizontal scroll for narrow content
-                    # canvas.itemconfig(frame_in_canvas_id, width=canvas.winfo_width()) 
-                    # Default: canvas item width will be frame's natural width.
-                    # canvas.itemconfig(frame_in_canvas_id, width=event.width) # event.width is frame's width
-
-                frame_in_canvas.bind("<Configure>", on_frame_configure)
-
-                # Call update_idletasks to ensure widgets are sized before getting bbox
-                actual_preview_win.update_idletasks()
-                canvas.configure(scrollregion=canvas.bbox("all"))
-
-                def _on_mousewheel_scroll(event):
-                    if event.num == 4: # Linux scroll up
-                        canvas.yview_scroll(-1, "units")
-                    elif event.num == 5: # Linux scroll down
-                        canvas.yview_scroll(1, "units")
-                    else: # Windows/MacOS
-                        canvas.yview_scroll(int(-1 * (event.delta / 120)), "units")
-
-                def _set_focus_on_enter(event): # Ensure canvas gets focus on mouse enter
-                    canvas.focus_set()
-
-                canvas.bind("<MouseWheel>", _on_mousewheel_scroll)
-                canvas.bind("<Button-4>", _on_mousewheel_scroll) # For Linux scroll up
-                canvas.bind("<Button-5>", _on_mousewheel_scroll) # For Linux scroll down
-                canvas.bind("<Enter>", _set_focus_on_enter) # Added binding for focus on enter
-                canvas.focus_set() # Set initial focus
-
-                actual_preview_win.protocol("WM_DELETE_WINDOW", actual_preview_win.destroy)
-                actual_preview_win.focus_set()
-
-            except Exception as e_setup:
-                error_msg = f"Failed to display preview: {str(e_setup)}"
-                print(f"ERROR_DEBUG: Caught in e_setup of _setup_actual_preview_window: {error_msg}") 
-                try:
-                    # Determine parent for messagebox
-                    msg_parent = self.root
-                    # Check if actual_preview_win was created and still exists to be a parent
-                    # However, if it's in an error state, self.root might be safer.
-                    # Let's use self.root to ensure the messagebox is always displayed.
-                    
-                    tk.messagebox.showerror("Preview Setup Error", error_msg, parent=self.root)
-
-                    if hasattr(self, 'status_label') and self.status_label.winfo_exists():
-                        self.status_label.config(text=error_msg, fg="red")
-                except Exception as final_e: # Error trying to report error
-                    print(f"ERROR_DEBUG: Original error during preview setup: {error_msg}")
-                    print(f"ERROR_DEBUG: Error during error reporting: {final_e}")
-                
-                if actual_preview_win and actual_preview_win.winfo_exists():
-                    actual_preview_win.destroy()
-
-        conversion_thread = threading.Thread(
-            target=_process_conversion_and_display, daemon=True
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(run_job, *job, compress=compress, streaming=streaming)
+            for job in jobs
+        ]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def _format_rate(pages, nbytes, seconds):
+    seconds = max(seconds, 1e-9)
+    return f"{pages / seconds:.1f} pages/s, {nbytes / seconds / 1e6:.2f} MB/s"
+
+
+def _print_result(result):
+    if result["exit_code"] == EXIT_OK:
+        print(
+            f"[exit {result['exit_code']}] {result['input']} -> {result['output']}: "
+            f"{result['pages']} pages in {result['seconds']:.2f}s "
+            f"({_format_rate(result['pages'], result['bytes'], result['seconds'])})"
+        )
+    else:
+        print(
+            f"[exit {result['exit_code']}] {result['input']} -> {result['output']}: "
+            f"{result['error']}",
+            file=sys.stderr,
         )
-        conversion_thread.start()
 
-    def parse_page_selection(self, selection_str, total_pages):
+
+class ServiceBusy(Exception):
+    """Every worker of the HTTP service is busy and its queue is full."""
+
+
+class SliceService:
+    """
+    State shared by the requests of the HTTP service. At most `workers` slices
+    run at once and up to `queue` more requests wait for one; beyond that
+    requests are refused with ServiceBusy, so a burst cannot pile up unbounded
+    work. Inputs go through open_document, so repeated requests on the same
+    file (or the same uploaded content) reuse its parsed document.
+    """
+
+    def __init__(
+        self,
+        root=".",
+        workers=None,
+        queue=SERVICE_QUEUE,
+        max_upload_bytes=SERVICE_MAX_UPLOAD_BYTES,
+    ):
+        self.root = os.path.realpath(root)
+        self.workers = workers or PREVIEW_WORKERS
+        self.queue = queue
+        self.max_upload_bytes = max_upload_bytes
+        self.work_dir = tempfile.mkdtemp(prefix="pdf_slicer_service_")
+        self._admitted = threading.BoundedSemaphore(self.workers + queue)
+        self._running = threading.BoundedSemaphore(self.workers)
+        self._lock = threading.Lock()
+        self._counts = {"active": 0, "waiting": 0, "served": 0, "rejected": 0}
+
+    @contextlib.contextmanager
+    def admitted(self):
+        """Hold a place for one request; raises ServiceBusy when none is left."""
+        if not self._admitted.acquire(blocking=False):
+            self._count("rejected", 1)
+            raise ServiceBusy()
+        try:
+            yield
+        finally:
+            self._admitted.release()
+
+    def _count(self, name, delta):
+        with self._lock:
+            self._counts[name] += delta
+
+    def status(self):
+        """Counters for the /health endpoint."""
+        with self._lock:
+            status = dict(self._counts)
+        status.update(workers=self.workers, queue=self.queue, documents=len(_documents))
+        return status
+
+    def resolve_path(self, path):
+        """Absolute path of a file requested by path; it must be under root."""
+        real_path = os.path.realpath(os.path.join(self.root, path))
+        if os.path.commonpath([real_path, self.root]) != self.root:
+            raise PermissionError(f"{path} is outside the served directory")
+        return real_path
+
+    def store_upload(self, stream, length):
         """
-        Parse the page selection string into a list of 0-based page indices.
-        Example input: "1-2, 5-7, 11, 13"
-        Returns: [0, 1, 4, 5, 6, 10, 12]
+        Save `length` bytes of an uploaded PDF and return its path. The file is
+        named after its content hash, so uploading the same PDF again reuses it.
         """
-        pages = []
-        parts = selection_str.split(",")
-        for part in parts:
-            part = part.strip()
-            if not part:  # Skip empty parts
-                continue
-            if "-" in part:
-                start_end = part.split("-")
-                if len(start_end) != 2:
-                    raise ValueError(f"Invalid range: {part}")
-                start, end = start_end
-                start = int(start.strip())
-                end = int(end.strip())
-                if start > end:
-                    raise ValueError(f"Invalid range: {start} > {end}")
-                for p in range(start, end + 1):
-                    if p < 1 or p > total_pages:
-                        raise ValueError(f"Page {p} is out of range (1-{total_pages})")
-                    pages.append(p - 1)  # Convert to 0-based index
+        digest = hashlib.blake2b(digest_size=20)
+        fd, tmp_path = tempfile.mkstemp(suffix=".upload", dir=self.work_dir)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                remaining = length
+                while remaining:
+                    chunk = stream.read(min(1024 * 1024, remaining))
+                    if not chunk:
+                        raise ValueError("The upload ended early")
+                    digest.update(chunk)
+                    f.write(chunk)
+                    remaining -= len(chunk)
+            path = os.path.join(self.work_dir, f"upload-{digest.hexdigest()}.pdf")
+            if os.path.exists(path):
+                # Keep the old file so its parsed document stays valid
+                os.remove(tmp_path)
+                os.utime(path)
             else:
-                p = int(part)
-                if p < 1 or p > total_pages:
-                    raise ValueError(f"Page {p} is out of range (1-{total_pages})")
-                pages.append(p - 1)  # Convert to 0-based index
-        return pages
+                os.replace(tmp_path, path)
+                self._trim_uploads()
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return path
+
+    def _trim_uploads(self):
+        # Keep enough recent uploads for every request that may still use one
+        uploads = []
+        for name in os.listdir(self.work_dir):
+            if name.startswith("upload-"):
+                path = os.path.join(self.work_dir, name)
+                try:
+                    uploads.append((os.stat(path).st_mtime, path))
+                except OSError:
+                    pass
+        keep = max(DOCUMENT_CACHE_SIZE, self.workers + self.queue)
+        for _, path in sorted(uploads, reverse=True)[keep:]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass  # Still open on Windows, try again next time
+
+    def slice(self, input_path, selection_str, compress=False):
+        """
+        Wait for a free worker, slice into a temporary file and return its path
+        and the number of pages. The caller removes the file.
+        """
+        self._count("waiting", 1)
+        with self._running:
+            self._count("waiting", -1)
+            self._count("active", 1)
+            try:
+                fd, output_path = tempfile.mkstemp(suffix=".pdf", dir=self.work_dir)
+                os.close(fd)
+                try:
+                    pages = slice_pdf(input_path, selection_str, output_path, compress=compress)
+                except BaseException:
+                    os.remove(output_path)
+                    raise
+                return output_path, pages
+            finally:
+                self._count("active", -1)
+                self._count("served", 1)
+
+    def close(self):
+        """Remove the uploads and any leftover outputs."""
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+
+
+def make_http_server(service, host="127.0.0.1", port=8765):
+    """
+    Return a threading HTTP server for a SliceService; call serve_forever().
+      GET  /health                            counters as JSON
+      GET  /slice?path=in.pdf&selection=1-3   slice a file under the service root
+      POST /slice?selection=1-3               slice the PDF sent as the request body
+    Add compress=1 to Flate-compress streams. Errors are JSON {"error": message}
+    with status 400 (bad selection or PDF), 403, 404, 413, 503 (busy) or 500.
+    """
+    import http.server  # Deferred, the window never needs it
+
+    class SliceRequestHandler(http.server.BaseHTTPRequestHandler):
+        server_version = "PDFSlicer"
+
+        def do_GET(self):
+            self._handle(upload=False)
+
+        def do_POST(self):
+            self._handle(upload=True)
+
+        def _handle(self, upload):
+            url = urllib.parse.urlsplit(self.path)
+            query = dict(urllib.parse.parse_qsl(url.query))
+            if url.path == "/health" and not upload:
+                return self._send_json(200, service.status())
+            if url.path != "/slice":
+                return self._send_json(404, {"error": "Not found"})
+            selection_str = query.get("selection", "")
+            compress = query.get("compress", "").lower() in ("1", "true", "yes")
+            try:
+                with service.admitted(), instrumentation.stage("request", upload=upload):
+                    if upload:
+                        length = int(self.headers.get("Content-Length") or 0)
+                        if length > service.max_upload_bytes:
+                            return self._send_json(413, {"error": "Upload too large"})
+                        if length <= 0:
+                            raise ValueError("Send the PDF as the request body")
+                        input_path = service.store_upload(self.rfile, length)
+                        name = "slice.pdf"
+                    else:
+                        if not query.get("path"):
+                            raise ValueError("Missing path")
+                        input_path = service.resolve_path(query["path"])
+                        name = os.path.splitext(os.path.basename(input_path))[0] + "_slice.pdf"
+                    if not selection_str.strip():
+                        raise ValueError("Missing selection")
+                    output_path, pages = service.slice(input_path, selection_str, compress)
+                    try:
+                        self._send_file(output_path, name, pages)
+                    finally:
+                        os.remove(output_path)
+            except ServiceBusy:
+                self._send_json(
+                    503, {"error": "Busy, try again later"}, {"Retry-After": "1"}
+                )
+            except (BrokenPipeError, ConnectionResetError):
+                pass  # The client went away
+            except (ValueError, PyPDF2.errors.PyPdfError) as e:
+                self._send_json(400, {"error": str(e)})
+            except PermissionError as e:
+                self._send_json(403, {"error": str(e)})
+            except FileNotFoundError as e:
+                self._send_json(404, {"error": f"No such file: {e.filename}"})
+            except Exception as e:
+                self._send_json(500, {"error": str(e)})
+
+        def _send_file(self, path, name, pages):
+            self.send_response(200)
+            self.send_header("Content-Type", "application/pdf")
+            self.send_header("Content-Length", str(os.path.getsize(path)))
+            self.send_header("Content-Disposition", f'attachment; filename="{name}"')
+            self.send_header("X-Pages", str(pages))
+            self.end_headers()
+            with open(path, "rb") as f:
+                shutil.copyfileobj(f, self.wfile, 1024 * 1024)
+
+        def _send_json(self, status, body, headers=None):
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+    server = http.server.ThreadingHTTPServer((host, port), SliceRequestHandler)
+    server.daemon_threads = True
+    return server
+
+
+COMPRESS_HELP = "Flate-compress streams that are stored uncompressed"
+STREAM_HELP = (
+    "write pages as they are extracted, with bounded memory "
+    "(default for inputs of 256 MB or more)"
+)
+
+
+def build_arg_parser():
+    """Command line interface; without a command the GUI is started."""
+    parser = argparse.ArgumentParser(
+        prog="pdf_slicer.py",
+        description="Extract pages from PDF files. Run without arguments for the GUI.",
+    )
+    parser.add_argument(
+        "--log", metavar="FILE", help="append per-stage timings to FILE as JSON lines"
+    )
+    parser.add_argument(
+        "--profile", metavar="FILE", help="write cProfile stats of the run to FILE"
+    )
+    parser.add_argument(
+        "--startup-time",
+        action="store_true",
+        help="open the window, print how long startup took and exit",
+    )
+    commands = parser.add_subparsers(dest="command")
+
+    slice_cmd = commands.add_parser("slice", help="extract pages from one PDF")
+    slice_cmd.add_argument("input", help="input PDF")
+    slice_cmd.add_argument("selection", help='page selection, e.g. "1, 3-5, 7"')
+    slice_cmd.add_argument("-o", "--output", required=True, help="output PDF")
+    slice_cmd.add_argument("--compress", action="store_true", help=COMPRESS_HELP)
+    slice_cmd.add_argument("--stream", action="store_true", help=STREAM_HELP)
+
+    split_cmd = commands.add_parser(
+        "split", help="write many PDFs from one input in a single pass"
+    )
+    split_cmd.add_argument("input", help="input PDF")
+    split_how = split_cmd.add_mutually_exclusive_group(required=True)
+    split_how.add_argument(
+        "--selections",
+        help='page selections separated by semicolons, e.g. "1-3; 4-9; 10-"',
+    )
+    split_how.add_argument(
+        "--every", type=int, metavar="N", help="one output per N pages"
+    )
+    split_how.add_argument(
+        "--bookmarks", action="store_true", help="one output per top-level bookmark"
+    )
+    split_cmd.add_argument(
+        "-o",
+        "--output",
+        default=None,
+        help="output name pattern with {n} (part number) and {title} (bookmark), "
+        "default: <input>_{n:03}.pdf",
+    )
+    split_cmd.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help="processes writing outputs (default: 1)",
+    )
+    split_cmd.add_argument("--compress", action="store_true", help=COMPRESS_HELP)
+
+    batch_cmd = commands.add_parser(
+        "batch", help="run the jobs of a CSV manifest (input,selection,output)"
+    )
+    batch_cmd.add_argument("manifest", help="CSV file with a header row")
+    batch_cmd.add_argument(
+        "-j", "--jobs", type=int, default=None, help="worker processes (default: CPUs)"
+    )
+    batch_cmd.add_argument(
+        "--json", action="store_true", help="print one JSON result per job instead"
+    )
+    batch_cmd.add_argument("--compress", action="store_true", help=COMPRESS_HELP)
+    batch_cmd.add_argument("--stream", action="store_true", help=STREAM_HELP)
+
+    merge_cmd = commands.add_parser(
+        "merge", help="combine pages of several PDFs into one"
+    )
+    merge_cmd.add_argument(
+        "selection", help='pages per input file, e.g. "a.pdf:1-3, b.pdf:7, c.pdf"'
+    )
+    merge_cmd.add_argument("-o", "--output", required=True, help="output PDF")
+    merge_cmd.add_argument(
+        "-j", "--jobs", type=int, default=None, help="threads opening the inputs"
+    )
+    merge_cmd.add_argument("--compress", action="store_true", help=COMPRESS_HELP)
+    merge_cmd.add_argument("--stream", action="store_true", help=STREAM_HELP)
+
+    serve_cmd = commands.add_parser("serve", help="run a local HTTP slicing service")
+    serve_cmd.add_argument(
+        "--host",
+        default="127.0.0.1",
+        help="address to listen on (default: 127.0.0.1, this machine only)",
+    )
+    serve_cmd.add_argument(
+        "--port", type=int, default=8765, help="port to listen on (default: 8765)"
+    )
+    serve_cmd.add_argument(
+        "-j", "--jobs", type=int, default=None, help="concurrent slices (default: CPUs)"
+    )
+    serve_cmd.add_argument(
+        "--queue",
+        type=int,
+        default=SERVICE_QUEUE,
+        help=f"requests that may wait for a worker before 503 (default: {SERVICE_QUEUE})",
+    )
+    serve_cmd.add_argument(
+        "--root",
+        default=".",
+        help="directory that ?path= inputs must be in (default: current directory)",
+    )
+    serve_cmd.add_argument(
+        "--max-upload",
+        type=int,
+        default=SERVICE_MAX_UPLOAD_BYTES // (1024 * 1024),
+        metavar="MB",
+        help="largest accepted upload (default: %(default)s MB)",
+    )
+    return parser
+
+
+def _run_split(args):
+    """Run the split command; returns the exit code."""
+    if args.output:
+        pattern = args.output
+    else:
+        # Braces in the input name are literal, not pattern fields
+        stem = os.path.splitext(args.input)[0].replace("{", "{{").replace("}", "}}")
+        pattern = stem + "_{n:03}.pdf"
+    started = time.perf_counter()
+    try:
+        document = open_document(args.input)
+        if args.selections is not None:
+            with document.lock:
+                selections = [
+                    parse_page_selection(part, document.page_count, document.path)
+                    for part in args.selections.split(";")
+                    if part.strip()
+                ]
+            titled = [("", selection) for selection in selections]
+        elif args.every is not None:
+            titled = [
+                ("", selection)
+                for selection in split_every(document.page_count, args.every)
+            ]
+        else:
+            titled = split_by_bookmarks(document)
+    except ValueError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return EXIT_BAD_SELECTION
+    except Exception as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return EXIT_FAILED
+
+    parts = []
+    for n, (title, selection) in enumerate(titled, 1):
+        # Keep bookmark titles usable as file names
+        safe_title = re.sub(r'[\\/:*?"<>|]+', "_", title).strip() or str(n)
+        try:
+            output_path = pattern.format(n=n, title=safe_title)
+        except (IndexError, KeyError, ValueError) as e:
+            print(
+                f"Error: invalid output pattern {pattern!r} ({e!r}), "
+                "use {n} and {title}, and {{ }} for literal braces",
+                file=sys.stderr,
+            )
+            return EXIT_BAD_SELECTION
+        parts.append((selection, output_path))
+
+    nbytes = 0
+
+    def _report(output_path, pages):
+        nonlocal nbytes
+        nbytes += os.path.getsize(output_path)
+        print(f"{output_path}: {pages} pages", flush=True)
+
+    try:
+        pages = split_pdf(
+            document, parts, workers=args.jobs, progress=_report, compress=args.compress
+        )
+    except ValueError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return EXIT_BAD_SELECTION
+    except Exception as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return EXIT_FAILED
+    elapsed = time.perf_counter() - started
+    print(
+        f"{len(parts)} files, {pages} pages in {elapsed:.2f}s "
+        f"({_format_rate(pages, nbytes, elapsed)})"
+    )
+    return EXIT_OK
+
+
+def main(argv=None):
+    """Entry point; returns the process exit code."""
+    args = build_arg_parser().parse_args(argv)
+    if args.log:
+        instrumentation.log_path = args.log
+    if args.profile:
+        instrumentation.profile_path = args.profile
+    try:
+        return instrumentation.profiled(_run_command)(args)
+    finally:
+        instrumentation.dump_profile()
+
+
+def _report_startup_time(root):
+    """Print how long the window took to appear and the warm-up, then quit."""
+    root.update()
+    shown = time.perf_counter() - _STARTED
+    deferred = [module._name for module in WARM_UP_MODULES if module._module is None]
+    warm_up()
+    warmed = time.perf_counter() - _STARTED
+    print(f"window shown after {shown * 1000:.0f} ms (since module load)")
+    print(f"warm-up done after {warmed * 1000:.0f} ms")
+    for record in instrumentation.records:
+        if record["stage"] == "import":
+            print(f"  import {record['module']:<20}{record['seconds'] * 1000:8.1f} ms")
+    print("deferred until after the window: " + (", ".join(deferred) or "none"))
+    root.destroy()
+
+
+def _run_merge(args):
+    """Run the merge command; returns the exit code."""
+    started = time.perf_counter()
+    try:
+        pages = merge_pdfs(
+            args.selection,
+            args.output,
+            workers=args.jobs,
+            compress=args.compress,
+            streaming=args.stream or None,
+        )
+    except ValueError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return EXIT_BAD_SELECTION
+    except Exception as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return EXIT_FAILED
+    elapsed = time.perf_counter() - started
+    nbytes = os.path.getsize(args.output)
+    print(
+        f"{args.output}: {pages} pages in {elapsed:.2f}s "
+        f"({_format_rate(pages, nbytes, elapsed)})"
+    )
+    return EXIT_OK
+
+
+def _run_serve(args):
+    """Run the HTTP service until interrupted; returns the exit code."""
+    global DOCUMENT_MMAP
+    # Served files can be replaced at any time, and SIGBUS would end the service
+    DOCUMENT_MMAP = False
+    service = SliceService(
+        args.root, args.jobs, args.queue, args.max_upload * 1024 * 1024
+    )
+    try:
+        server = make_http_server(service, args.host, args.port)
+    except OSError as e:
+        service.close()
+        print(f"Error: {e}", file=sys.stderr)
+        return EXIT_FAILED
+    print(
+        f"Serving {service.root} on http://{args.host}:{server.server_port}/ "
+        f"({service.workers} workers, queue of {service.queue})",
+        flush=True,
+    )
+    # Clean up on `kill` too, not only on Ctrl+C
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(EXIT_OK))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+    return EXIT_OK
+
+
+def _run_command(args):
+    """Run the parsed command line; returns the exit code."""
+    if args.command is None:
+        root = tk.Tk()
+        root.title("PDF Page Extractor")
+        PDFExtractor(root)
+        if args.startup_time:
+            root.after_idle(_report_startup_time, root)
+        else:
+            # Load the PDF and imaging libraries while the user picks a file
+            root.after_idle(
+                lambda: threading.Thread(target=warm_up, daemon=True).start()
+            )
+        root.mainloop()
+        return EXIT_OK
+
+    if args.command == "slice":
+        result = run_job(
+            args.input,
+            args.selection,
+            args.output,
+            compress=args.compress,
+            streaming=args.stream or None,
+        )
+        _print_result(result)
+        return result["exit_code"]
+
+    if args.command == "split":
+        return _run_split(args)
+
+    if args.command == "serve":
+        return _run_serve(args)
+
+    if args.command == "merge":
+        return _run_merge(args)
+
+    # batch
+    try:
+        jobs = read_manifest(args.manifest)
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return EXIT_FAILED
+    started = time.perf_counter()
+    pages = nbytes = failed = 0
+    for result in run_batch(jobs, args.jobs, args.compress, args.stream or None):
+        if args.json:
+            print(json.dumps(result), flush=True)
+        else:
+            _print_result(result)
+        pages += result["pages"]
+        nbytes += result["bytes"]
+        failed += result["exit_code"] != EXIT_OK
+    elapsed = time.perf_counter() - started
+    if not args.json:
+        print(
+            f"{len(jobs)} jobs, {failed} failed, {pages} pages in {elapsed:.2f}s "
+            f"({_format_rate(pages, nbytes, elapsed)})"
+        )
+    return EXIT_FAILED if failed else EXIT_OK
 
 
 if __name__ == "__main__":
-    root = tk.Tk()
-    root.title("PDF Page Extractor")
-    app = PDFExtractor(root)
-    root.mainloop()
+    sys.exit(main())
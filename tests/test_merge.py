@@ -0,0 +1,67 @@
+"""Tests for selections over several input files and merge_pdfs."""
+import os
+import sys
+
+import pytest
+from PyPDF2 import PdfReader, PdfWriter
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+import pdf_slicer  # noqa: E402
+
+
+def write_pdf(path, widths):
+    """Write a PDF with one blank page per width, so pages can be told apart."""
+    writer = PdfWriter()
+    for width in widths:
+        writer.add_blank_page(width, 100)
+    with open(path, "wb") as f:
+        writer.write(f)
+
+
+def page_widths(path):
+    return [int(page.mediabox.width) for page in PdfReader(path, strict=True).pages]
+
+
+def test_parts_without_a_file_continue_the_previous_one():
+    assert pdf_slicer.parse_multi_selection("a.pdf:1-3, 5, b.pdf:7, a.pdf") == [
+        ("a.pdf", "1-3, 5"),
+        ("b.pdf", "7"),
+        ("a.pdf", "1-"),
+    ]
+
+
+def test_base_dir_and_spaces():
+    assert pdf_slicer.parse_multi_selection(
+        " my file.PDF : 2 , 4 ", base_dir="in"
+    ) == [(os.path.join("in", "my file.PDF"), "2, 4")]
+
+
+def test_text_query_naming_a_pdf_is_not_a_file():
+    assert pdf_slicer.parse_multi_selection('a.pdf:1, text:"see b.pdf"') == [
+        ("a.pdf", '1, text:"see b.pdf"')
+    ]
+
+
+def test_file_names_starting_with_text():
+    assert pdf_slicer.parse_multi_selection("a.pdf:1, textbook.pdf:1-2, texts/b.pdf") == [
+        ("a.pdf", "1"),
+        ("textbook.pdf", "1-2"),
+        ("texts/b.pdf", "1-"),
+    ]
+
+
+def test_selection_without_a_file_is_rejected():
+    with pytest.raises(ValueError):
+        pdf_slicer.parse_multi_selection("1-3, a.pdf")
+
+
+def test_merge_keeps_the_requested_order(tmp_path):
+    write_pdf(tmp_path / "a.pdf", [101, 102, 103])
+    write_pdf(tmp_path / "textbook.pdf", [201, 202])
+    output = str(tmp_path / "out.pdf")
+    pages = pdf_slicer.merge_pdfs(
+        "textbook.pdf:2, a.pdf:3-1, textbook.pdf", output, base_dir=str(tmp_path)
+    )
+    assert pages == 6
+    assert page_widths(output) == [202, 103, 102, 101, 201, 202]
@@ -0,0 +1,74 @@
+"""Tests for optimize_writer: merged duplicates must still read back strictly."""
+import io
+import os
+import sys
+
+import pytest
+from PIL import Image
+from PyPDF2 import PdfReader, PdfWriter
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+import pdf_slicer  # noqa: E402
+
+
+def image_page(color):
+    """A page showing a small image of one color, read from its own PDF."""
+    buf = io.BytesIO()
+    Image.new("RGB", (40, 40), color).save(buf, "PDF")
+    buf.seek(0)
+    return PdfReader(buf).pages[0]
+
+
+def image_data(reader):
+    """The image data of every page of reader, in page order."""
+    return [
+        xobject.get_object().get_data()
+        for page in reader.pages
+        for xobject in page["/Resources"]["/XObject"].values()
+    ]
+
+
+def count_images(path):
+    """Number of image objects stored in the file."""
+    reader = PdfReader(path, strict=True)
+    return sum(
+        1
+        for idnum in range(1, int(reader.trailer["/Size"]))
+        if getattr(reader.get_object(idnum), "get", lambda key: None)("/Subtype")
+        == "/Image"
+    )
+
+
+@pytest.fixture
+def input_pdf(tmp_path):
+    """Pages 1 and 3 are equal but separate copies, page 2 differs."""
+    writer = PdfWriter()
+    for color in ("red", "blue", "red"):
+        writer.add_page(image_page(color))
+    path = str(tmp_path / "in.pdf")
+    with open(path, "wb") as f:
+        writer.write(f)
+    return path
+
+
+@pytest.mark.parametrize("compress", [False, True])
+def test_repeated_pages_and_resources_are_stored_once(input_pdf, tmp_path, compress):
+    output = str(tmp_path / "out.pdf")
+    pages = pdf_slicer.slice_pdf(
+        input_pdf, "1, 1, 2, 3, 1", output, compress=compress, streaming=False
+    )
+    assert pages == 5
+    reader = PdfReader(output, strict=True)
+    assert len(reader.pages) == 5
+    original = image_data(PdfReader(input_pdf))
+    assert image_data(reader) == [original[i] for i in (0, 0, 1, 2, 0)]
+    # One red and one blue image, however often they are used
+    assert count_images(output) == 2
+
+
+def test_unreachable_objects_are_dropped(input_pdf, tmp_path):
+    output = str(tmp_path / "out.pdf")
+    pdf_slicer.slice_pdf(input_pdf, "2", output, streaming=False)
+    assert count_images(output) == 1
+    assert len(PdfReader(output, strict=True).pages) == 1
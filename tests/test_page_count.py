@@ -0,0 +1,174 @@
+"""Tests for the hand-written xref reader behind quick_page_count/count_pages."""
+import os
+import struct
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+import pdf_slicer  # noqa: E402
+
+
+def page_objects(pages, count=None):
+    """
+    Objects of a minimal document: catalog 1, page tree 2 and one empty page
+    per page from object 3 on. count replaces the /Count value if given.
+    """
+    kids = b" ".join(b"%d 0 R" % (3 + i) for i in range(pages))
+    objects = {
+        1: b"<< /Type /Catalog /Pages 2 0 R >>",
+        2: b"<< /Type /Pages /Kids [%s] /Count %s >>"
+        % (kids, count if count is not None else b"%d" % pages),
+    }
+    for i in range(pages):
+        objects[3 + i] = b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 200 200] >>"
+    return objects
+
+
+def write_pdf(path, objects, xref="table", eol=b" \n", header=b"", data=b""):
+    """
+    Write objects ({number: body}) with a classic xref table or, with
+    xref="stream", a cross-reference stream. header is written before the
+    first object; data is appended after %%EOF (e.g. an incremental update).
+    """
+    out = bytearray(b"%PDF-1.5\n%\xe2\xe3\xcf\xd3\n" + header)
+    offsets = {}
+    for number in sorted(objects):
+        offsets[number] = len(out)
+        out += b"%d 0 obj\n%s\nendobj\n" % (number, objects[number])
+    size = max(objects) + 1
+    if xref == "table":
+        xref_offset = len(out)
+        out += b"xref\n0 %d\n0000000000 65535 f%s" % (size, eol)
+        for number in range(1, size):
+            out += b"%010d 00000 n%s" % (offsets[number], eol)
+        out += b"trailer\n<< /Size %d /Root 1 0 R >>\n" % size
+    else:
+        xref_offset = len(out)
+        offsets[size] = xref_offset
+        rows = struct.pack(">BIH", 0, 0, 65535)
+        for number in range(1, size + 1):
+            rows += struct.pack(">BIH", 1, offsets[number], 0)
+        out += (
+            b"%d 0 obj\n<< /Type /XRef /Size %d /Root 1 0 R /W [1 4 2] "
+            b"/Length %d >>\nstream\n" % (size, size + 1, len(rows))
+        )
+        out += rows + b"\nendstream\nendobj\n"
+    out += b"startxref\n%d\n%%%%EOF\n" % xref_offset
+    with open(path, "wb") as f:
+        f.write(out + data)
+    return bytes(out)
+
+
+def update(base, objects, prev_size):
+    """An incremental update replacing `objects` of a document ending in base."""
+    out = bytearray()
+    offsets = {}
+    for number in sorted(objects):
+        offsets[number] = len(base) + len(out)
+        out += b"%d 0 obj\n%s\nendobj\n" % (number, objects[number])
+    xref_offset = len(base) + len(out)
+    out += b"xref\n0 1\n0000000000 65535 f \n"
+    for number in sorted(objects):
+        out += b"%d 1\n%010d 00000 n \n" % (number, offsets[number])
+    prev = int(base.rsplit(b"startxref", 1)[1].split()[0])
+    out += b"trailer\n<< /Size %d /Root 1 0 R /Prev %d >>\n" % (prev_size, prev)
+    out += b"startxref\n%d\n%%%%EOF\n" % xref_offset
+    return bytes(out)
+
+
+@pytest.fixture(params=[True, False], ids=["mmap", "file"])
+def pdf(request, tmp_path, monkeypatch):
+    """Path for the test PDF; every test runs with and without DOCUMENT_MMAP."""
+    monkeypatch.setattr(pdf_slicer, "DOCUMENT_MMAP", request.param)
+    return str(tmp_path / "test.pdf")
+
+
+@pytest.mark.parametrize("eol", [b" \n", b"\r\n", b" \r", b"\n"])
+def test_classic_xref(pdf, eol):
+    write_pdf(pdf, page_objects(7), eol=eol)
+    assert pdf_slicer.quick_page_count(pdf) == 7
+    assert pdf_slicer.count_pages(pdf) == 7
+
+
+def test_count_with_many_digits(pdf):
+    write_pdf(pdf, page_objects(12))
+    assert pdf_slicer.quick_page_count(pdf) == 12
+
+
+def test_indirect_count_is_not_misread(pdf):
+    objects = page_objects(10, count=b"14 0 R")
+    objects[13] = b"10"
+    objects[14] = b"10"
+    write_pdf(pdf, objects)
+    with pytest.raises(ValueError):
+        pdf_slicer.quick_page_count(pdf)
+    assert pdf_slicer.count_pages(pdf) == 10
+
+
+def test_incremental_update_follows_prev(pdf):
+    objects = page_objects(4)
+    base = write_pdf(pdf, objects)
+    # The update adds a fifth page to the page tree
+    kids = b" ".join(b"%d 0 R" % n for n in range(3, 8))
+    data = update(
+        base,
+        {
+            2: b"<< /Type /Pages /Kids [%s] /Count 5 >>" % kids,
+            7: b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 200 200] >>",
+        },
+        8,
+    )
+    with open(pdf, "ab") as f:
+        f.write(data)
+    assert pdf_slicer.quick_page_count(pdf) == 5
+
+
+def test_linearized_uses_n_while_length_matches(pdf):
+    header = b"99 0 obj\n<< /Linearized 1 /L %010d /N 42 >>\nendobj\n"
+    size = len(write_pdf(pdf, page_objects(3), header=header % 0))
+    write_pdf(pdf, page_objects(3), header=header % size)
+    assert pdf_slicer.quick_page_count(pdf) == 42
+
+
+def test_linearized_with_stale_length_reads_xref(pdf):
+    header = b"99 0 obj\n<< /Linearized 1 /L 1 /N 42 >>\nendobj\n"
+    write_pdf(pdf, page_objects(3), header=header)
+    assert pdf_slicer.quick_page_count(pdf) == 3
+
+
+def test_broken_startxref_falls_back(pdf):
+    data = write_pdf(pdf, page_objects(6))
+    offset = int(data.rsplit(b"startxref", 1)[1].split()[0])
+    with open(pdf, "wb") as f:
+        f.write(data.replace(b"startxref\n%d" % offset, b"startxref\n%d" % (offset + 3)))
+    with pytest.raises(ValueError):
+        pdf_slicer.quick_page_count(pdf)
+    assert pdf_slicer.count_pages(pdf) == 6
+
+
+def test_wrong_object_offset_is_rejected(pdf):
+    data = write_pdf(pdf, page_objects(2))
+    # Point the page tree entry at the catalog
+    entries = data.split(b"xref\n", 1)[1].split(b"\n")
+    catalog_offset, pages_entry = entries[2][:10], entries[3]
+    with open(pdf, "wb") as f:
+        f.write(data.replace(pages_entry, catalog_offset + pages_entry[10:]))
+    with pytest.raises(ValueError):
+        pdf_slicer.quick_page_count(pdf)
+
+
+def test_xref_stream_reads_count_without_walking_the_page_tree(pdf):
+    write_pdf(pdf, page_objects(9), xref="stream")
+    with pytest.raises(ValueError):
+        pdf_slicer.quick_page_count(pdf)
+    assert pdf_slicer.count_pages(pdf) == 9
+    # The page tree was not flattened
+    assert pdf_slicer.open_document(pdf)._page_count is None
+
+
+def test_empty_file(pdf):
+    open(pdf, "wb").close()
+    with pytest.raises(ValueError):
+        pdf_slicer.quick_page_count(pdf)
@@ -0,0 +1,58 @@
+"""Tests for the page selection grammar of parse_page_selection."""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+import pdf_slicer  # noqa: E402
+
+
+def pages(selection, total=10):
+    """The 1-based pages a selection stands for in a document of `total` pages."""
+    return [p + 1 for p in pdf_slicer.parse_page_selection(selection, total)]
+
+
+@pytest.mark.parametrize(
+    "selection, expected",
+    [
+        ("1-2, 5-7, 11, 13", [1, 2, 5, 6, 7, 11, 13]),
+        ("5-3", [5, 4, 3]),
+        ("8-", [8, 9, 10, 11, 12, 13]),
+        ("-3", [1, 2, 3]),
+        ("1-9:2", [1, 3, 5, 7, 9]),
+        ("9-1:3", [9, 6, 3]),
+        ("10-:2", [10, 12]),
+        ("odd", [1, 3, 5, 7, 9, 11, 13]),
+        ("EVEN", [2, 4, 6, 8, 10, 12]),
+        ("1, 1, 2", [1, 1, 2]),
+        (" 3 ,, 4 , ", [3, 4]),
+    ],
+)
+def test_selection(selection, expected):
+    assert pages(selection, total=13) == expected
+
+
+def test_selection_stays_compact():
+    selection = pdf_slicer.parse_page_selection("1-1000000, 3", 1000000)
+    assert selection.ranges == [range(0, 1000000), range(2, 3)]
+    assert len(selection) == 1000001
+
+
+def test_empty_selection_is_false():
+    assert not pdf_slicer.parse_page_selection(" , ", 5)
+
+
+@pytest.mark.parametrize(
+    "selection",
+    ["0", "11", "3-11", "-", "1-x", "a", "1-5:0", "1--2", "2-1-", "text:"],
+)
+def test_invalid_selection(selection):
+    with pytest.raises(ValueError):
+        pages(selection)
+
+
+def test_text_query_needs_an_input():
+    with pytest.raises(ValueError, match="need an input"):
+        pages('text:"invoice"')
@@ -0,0 +1,95 @@
+"""Tests for StreamingPdfWriter: its output must match the regular writer's."""
+import io
+import os
+import sys
+
+import pytest
+from PIL import Image
+from PyPDF2 import PdfReader, PdfWriter
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+import pdf_slicer  # noqa: E402
+
+
+def write_input(path, colors, rotate=()):
+    """
+    Write a PDF with one image page per color (None for a blank page), with
+    the 0-based pages in `rotate` turned by 90 degrees.
+    """
+    writer = PdfWriter()
+    for i, color in enumerate(colors):
+        if color is None:
+            writer.add_blank_page(100 + i, 200)
+        else:
+            buf = io.BytesIO()
+            Image.new("RGB", (30, 20), color).save(buf, "PDF")
+            buf.seek(0)
+            writer.add_page(PdfReader(buf).pages[0])
+        if i in rotate:
+            writer.pages[i].rotate(90)
+    with open(path, "wb") as f:
+        writer.write(f)
+
+
+def describe(path):
+    """What each page of a PDF shows: its boxes, rotation, contents and images."""
+    pages = []
+    for page in PdfReader(path, strict=True).pages:
+        contents = page.get_contents()
+        xobjects = page.get("/Resources", {}).get("/XObject", {})
+        pages.append(
+            (
+                [float(x) for x in page.mediabox],
+                page.get("/Rotate", 0),
+                contents.get_data() if contents is not None else b"",
+                sorted(x.get_object().get_data() for x in xobjects.values()),
+            )
+        )
+    return pages
+
+
+@pytest.fixture
+def inputs(tmp_path):
+    a = str(tmp_path / "a.pdf")
+    b = str(tmp_path / "b.pdf")
+    write_input(a, ["red", None, "blue", "red"], rotate={1})
+    write_input(b, ["blue", None, "green"])
+    return a, b
+
+
+@pytest.mark.parametrize("selection", ["1-4", "4-1", "1, 1, 3, 2, 1", "odd"])
+def test_streaming_matches_regular_output(inputs, tmp_path, selection):
+    regular = str(tmp_path / "regular.pdf")
+    streamed = str(tmp_path / "streamed.pdf")
+    pdf_slicer.slice_pdf(inputs[0], selection, regular, streaming=False)
+    pdf_slicer.slice_pdf(inputs[0], selection, streamed, streaming=True)
+    assert describe(streamed) == describe(regular)
+
+
+def test_streaming_merge_matches_regular_output(inputs, tmp_path):
+    selection = "a.pdf:3, b.pdf:1-3, a.pdf:2, b.pdf:1"
+    regular = str(tmp_path / "regular.pdf")
+    streamed = str(tmp_path / "streamed.pdf")
+    pdf_slicer.merge_pdfs(selection, regular, streaming=False, base_dir=str(tmp_path))
+    pdf_slicer.merge_pdfs(selection, streamed, streaming=True, base_dir=str(tmp_path))
+    assert describe(streamed) == describe(regular)
+    assert len(describe(streamed)) == 6
+
+
+def test_identical_streams_are_written_once(inputs, tmp_path):
+    streamed = str(tmp_path / "streamed.pdf")
+    pdf_slicer.merge_pdfs(
+        "a.pdf:1, a.pdf:3, b.pdf:1, a.pdf:4",
+        streamed,
+        streaming=True,
+        base_dir=str(tmp_path),
+    )
+    reader = PdfReader(streamed, strict=True)
+    images = {
+        xobject.idnum
+        for page in reader.pages
+        for xobject in page["/Resources"]["/XObject"].values()
+    }
+    # Red is on a.pdf pages 1 and 4, blue on a.pdf page 3 and b.pdf page 1
+    assert len(images) == 2